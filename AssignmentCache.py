@@ -0,0 +1,88 @@
+import hashlib
+import numpy as np
+import shapely
+
+from Transformation import mesh_to_arrays, mesh_from_arrays
+
+ASSIGNMENT_VERSION = 1
+
+
+def assignment_key(transformer, layerId):
+    # The assignment of a layer depends on the base layer (scopes, footprints), the layer itself, the outlines and
+    # borderlines of the transformations and the MELs. Bend angles and other kernel parameters are not part of the
+    # key. None if one of the layers did not come through the mesh cache.
+    layers = transformer.layers
+    if transformer.assignmentCache is None or layers[0].meshKey is None or layers[layerId].meshKey is None:
+        return None
+    layer = layers[layerId]
+    digest = hashlib.sha256()
+    digest.update(layers[0].meshKey.encode())
+    digest.update(layer.meshKey.encode())
+    digest.update(repr((layerId, layer.mel, layer.mel_trans, layer.mel_residual, transformer.partitioner,
+                        transformer.reuse_partition, ASSIGNMENT_VERSION)).encode())
+    for tr in transformer.transformations:
+        parent = tr.parentTransformation.name if tr.parentTransformation is not None else None
+        digest.update(repr((type(tr).__name__, tr.name, tr.isResidual, tr.addResidual, parent)).encode())
+        if not tr.isResidual:
+            digest.update(shapely.to_wkb(tr.boundaries))
+            digest.update(np.asarray(tr.getBorderlinePts(), dtype=float).tobytes())
+    return "assign-" + digest.hexdigest()
+
+
+def put_mesh(arrays, name, mesh):
+    if mesh is None:
+        return
+    arrays[name + "_points"], arrays[name + "_faces"] = mesh_to_arrays(mesh)
+
+
+def get_mesh(data, name):
+    if name + "_points" not in data:
+        return None
+    return mesh_from_arrays(data[name + "_points"], data[name + "_faces"])
+
+
+def put_geometry(arrays, name, geometry):
+    if geometry is not None:
+        arrays[name] = np.frombuffer(shapely.to_wkb(geometry), dtype=np.uint8)
+
+
+def get_geometry(data, name):
+    if name not in data:
+        return None
+    geometry = shapely.from_wkb(data[name].tobytes())
+    shapely.prepare(geometry)
+    return geometry
+
+
+def store_assignment(cache, key, pieces, residuals, fixed, scopes=None, footprints=None, footprint=None):
+    # Pieces and residuals by transformation index. The base layer also keeps the scopes and the footprints of the
+    # nested transformations and of its fixed mesh; scopes are stored triangulated.
+    arrays = {}
+    for trId, mesh in pieces.items():
+        put_mesh(arrays, "piece_{}".format(trId), mesh)
+    for trId, mesh in residuals.items():
+        put_mesh(arrays, "residual_{}".format(trId), mesh)
+    put_mesh(arrays, "fixed", fixed)
+    for trId, scope in (scopes or {}).items():
+        if scope is not None:
+            put_mesh(arrays, "scope_{}".format(trId), scope.clone().triangulate())
+    for trId, geometry in (footprints or {}).items():
+        put_geometry(arrays, "footprint_{}".format(trId), geometry)
+    put_geometry(arrays, "footprint", footprint)
+    cache.store(key, **arrays)
+
+
+def load_assignment(cache, key):
+    # the stored assignment as a dict of pieces, residuals, fixed, scopes, footprints and footprint; None if missing
+    data = cache.load(key)
+    if data is None:
+        return None
+    ret = {"pieces": {}, "residuals": {}, "scopes": {}, "footprints": {}, "fixed": get_mesh(data, "fixed"),
+           "footprint": get_geometry(data, "footprint")}
+    for name in data:
+        parts = name.split("_")
+        if len(parts) == 3 and parts[2] == "points" and parts[0] in ("piece", "residual", "scope"):
+            ret[parts[0] + "s"][int(parts[1])] = get_mesh(data, parts[0] + "_" + parts[1])
+        elif len(parts) == 2 and parts[0] == "footprint":
+            ret["footprints"][int(parts[1])] = get_geometry(data, name)
+    return ret
@@ -0,0 +1,54 @@
+import concurrent.futures
+import contextlib
+import threading
+
+
+class Cancelled(Exception):
+    pass
+
+
+class CancellationToken:
+    # Cancelled from any thread, checked by the long running loops at points where they can stop without leaving
+    # half-written results behind. Tokens are not handed to worker processes; their futures are cancelled instead.
+    def __init__(self):
+        self.event = threading.Event()
+
+    def cancel(self):
+        self.event.set()
+
+    def cancelled(self):
+        return self.event.is_set()
+
+    def check(self):
+        if self.event.is_set():
+            raise Cancelled("Cancelled")
+
+
+def wait_cancellable(futures, token, interval=0.2):
+    # yields the futures as they complete; once the token is cancelled, the futures not started yet are cancelled
+    # and Cancelled is raised
+    pending = set(futures)
+    while pending:
+        done, pending = concurrent.futures.wait(pending, timeout=interval,
+                                                return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+            yield future
+        if token.cancelled():
+            for future in pending:
+                future.cancel()
+            token.check()
+
+
+@contextlib.contextmanager
+def cancellable_pool(pool):
+    # Like `with pool:`, except that Cancelled leaves right away. The queued jobs are dropped and the running ones are
+    # not waited for; where the executor supports it (Python 3.14+) their processes are terminated.
+    try:
+        yield pool
+    except Cancelled:
+        pool.shutdown(wait=False, cancel_futures=True)
+        terminate = getattr(pool, "terminate_workers", None)
+        if terminate is not None:
+            terminate()
+        raise
+    pool.shutdown(wait=True)
@@ -0,0 +1,116 @@
+import atexit
+import os
+import queue
+import threading
+import time
+from enum import IntEnum
+
+import vedo as v
+
+
+class Verbosity(IntEnum):
+    OFF = 0
+    BASIC = 1
+    VERBOSE = 2
+
+
+def parse_verbosity(value):
+    if isinstance(value, str) and not value.isdigit():
+        return Verbosity[value.upper()]
+    return Verbosity(int(value))
+
+
+class DebugArtifacts:
+    # Intermediate meshes written for debugging. Nothing touches the disk unless the verbosity is raised; then every
+    # run gets its own directory and the files are written by a background thread.
+
+    def __init__(self, level=Verbosity.OFF, directory=None):
+        self.level = parse_verbosity(level)
+        self.base = directory if directory else "ftl_debug"
+        self.directory = None
+        self.count = 0
+        self.queue = None
+        self.thread = None
+
+    @classmethod
+    def from_env(cls):
+        return cls(os.environ.get("FTL_DEBUG_LEVEL", 0), os.environ.get("FTL_DEBUG_DIR"))
+
+    def enabled(self, level=Verbosity.BASIC):
+        return self.level >= level
+
+    def write_mesh(self, name, mesh, level=Verbosity.BASIC):
+        if self.level < level or mesh is None:
+            return
+        if self.directory is None:
+            run = "{}-{}".format(time.strftime("%Y%m%d-%H%M%S"), os.getpid())
+            self.directory = os.path.join(self.base, run)
+            os.makedirs(self.directory, exist_ok=True)
+        if self.thread is None:
+            self.queue = queue.Queue(maxsize=16)
+            self.thread = threading.Thread(target=self.run, name="DebugArtifacts", daemon=True)
+            self.thread.start()
+            atexit.register(self.close)
+        self.count += 1
+        path = os.path.join(self.directory, "{:04d}_{}".format(self.count, name))
+        self.queue.put((path, mesh.clone()))
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            path, mesh = item
+            try:
+                v.write(mesh, path)
+            except Exception as e:
+                print("Could not write debug artifact '{}': {}".format(path, e))
+
+    def close(self):
+        if self.thread is None:
+            return
+        self.queue.put(None)
+        self.thread.join()
+        self.thread = None
+
+
+class DebugGeometry:
+    # Debug meshes shown next to the model. Only recipes building them are kept; the meshes are created when they are
+    # displayed, and building stops once they would take more than max_bytes. Disabled containers ignore all recipes.
+
+    def __init__(self, enabled=False, max_bytes=256 * 1024 ** 2):
+        self.enabled = enabled
+        self.max_bytes = max_bytes
+        self.recipes = {}
+
+    @classmethod
+    def from_env(cls):
+        enabled = os.environ.get("FTL_DEBUG_GEOMETRY", "0") not in ("", "0")
+        return cls(enabled, int(os.environ.get("FTL_DEBUG_GEOMETRY_LIMIT", 256)) * 1024 ** 2)
+
+    def add(self, label, recipe):
+        if self.enabled:
+            self.recipes[label] = recipe
+
+    def clear(self):
+        self.recipes.clear()
+
+    def build(self):
+        ret = []
+        used = 0
+        for label, recipe in self.recipes.items():
+            try:
+                item = recipe()
+            except (IndexError, KeyError, AttributeError):
+                # the recipe refers to a stage product that does not exist (anymore)
+                continue
+            if item is None:
+                continue
+            size = item.polydata().GetActualMemorySize() * 1024
+            if used + size > self.max_bytes:
+                print("Debug geometry limit of {} MB reached, skipping '{}' and all following items.".format(
+                    self.max_bytes // 1024 ** 2, label))
+                break
+            used += size
+            ret.append(item)
+        return ret
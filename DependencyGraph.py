@@ -0,0 +1,138 @@
+LOAD = "load"
+ASSIGN = "assign"
+SUBDIVIDE = "subdivide"
+TRANSFORM = "transform"
+MERGE = "merge"
+
+# transformation parameters that only change the bend itself, not the zone it cuts out of the layers
+TRANSFORM_KEYS = {
+    "ZBend": {"angle"},
+    "DirBend": {"angle"},
+    "Spiral": set(),
+}
+# parameters that no stage of the pipeline reads
+PASSIVE_KEYS = {"color", "priority"}
+PASSIVE_GLOBAL_KEYS = {"version", "workers", "cache", "assignment_cache", "debug"}
+
+
+class DependencyGraph:
+    def __init__(self):
+        self.edges = {}
+
+    def add(self, source, target):
+        self.edges.setdefault(source, set()).add(target)
+        self.edges.setdefault(target, set())
+
+    def affected(self, nodes):
+        ret = set()
+        stack = list(nodes)
+        while stack:
+            node = stack.pop()
+            if node in ret:
+                continue
+            ret.add(node)
+            stack.extend(self.edges.get(node, ()))
+        return ret
+
+    def stages(self, nodes, stage=None):
+        ret = {node for node in self.affected(nodes) if node[0] in (LOAD, ASSIGN, SUBDIVIDE, TRANSFORM, MERGE)}
+        if stage is None:
+            return ret
+        return {node for node in ret if node[0] == stage}
+
+
+def transformation_names(j_data):
+    names = []
+    for tr in j_data["transformations"]:
+        names.append(tr["name"])
+        names.append(tr["name"] + "-Res")
+    return names
+
+
+def build_pipeline_graph(j_data, changes):
+    # Edges from the changed JSON nodes to the stages reading them, plus the static edges between the stages.
+    # JSON nodes are ("global", key), ("layer", index, key) and ("transformation", name, key).
+    graph = DependencyGraph()
+    layerIds = range(len(j_data["layers"]))
+    names = transformation_names(j_data)
+    residuals = [name for name in names if name.endswith("-Res")]
+    primaries = [name for name in names if not name.endswith("-Res")]
+    types = {tr["name"]: tr.get("type") for tr in j_data["transformations"]}
+
+    for i in layerIds:
+        graph.add((LOAD, i), (ASSIGN,))
+    for name in names:
+        graph.add((ASSIGN,), (SUBDIVIDE, name))
+        graph.add((SUBDIVIDE, name), (TRANSFORM, name))
+        graph.add((TRANSFORM, name), (MERGE,))
+    for tr in j_data["transformations"]:
+        if "parent" in tr:
+            # nested bends follow the residual of their parent
+            graph.add((TRANSFORM, tr["parent"] + "-Res"), (TRANSFORM, tr["name"]))
+            graph.add((TRANSFORM, tr["parent"] + "-Res"), (TRANSFORM, tr["name"] + "-Res"))
+
+    for node in changes:
+        if node[0] == "global":
+            key = node[1]
+            if key in PASSIVE_GLOBAL_KEYS:
+                continue
+            elif key in ("mel_trans", "tolerance"):
+                for name in primaries:
+                    graph.add(node, (SUBDIVIDE, name))
+            elif key == "mel_residual":
+                for name in residuals:
+                    graph.add(node, (SUBDIVIDE, name))
+            elif key in ("partitioner", "reuse_partition"):
+                graph.add(node, (ASSIGN,))
+            else:
+                for i in layerIds:
+                    graph.add(node, (LOAD, i))
+        elif node[0] == "layer":
+            i, key = node[1], node[2]
+            if key in ("name", "color"):
+                graph.add(node, (MERGE,))
+            elif key == "mel_trans":
+                for name in primaries:
+                    graph.add(node, (SUBDIVIDE, name))
+            elif key == "mel_residual":
+                for name in residuals:
+                    graph.add(node, (SUBDIVIDE, name))
+            elif key == "file":
+                graph.add(node, (LOAD, i))
+            else:
+                graph.add(node, (ASSIGN,))
+        elif node[0] == "transformation":
+            name, key = node[1], node[2]
+            if key in PASSIVE_KEYS:
+                continue
+            elif key in TRANSFORM_KEYS.get(types.get(name), set()):
+                graph.add(node, (TRANSFORM, name))
+                graph.add(node, (TRANSFORM, name + "-Res"))
+            else:
+                graph.add(node, (ASSIGN,))
+    return graph
+
+
+def diff_project(old, new):
+    # Changed JSON nodes between two versions of a project, or None if layers or transformations were added,
+    # removed, renamed, retyped or re-nested, which needs a full rebuild.
+    if len(old["layers"]) != len(new["layers"]) or len(old["transformations"]) != len(new["transformations"]):
+        return None
+    changes = set()
+    for key in set(old) | set(new):
+        if key in ("layers", "transformations"):
+            continue
+        if str(old.get(key)) != str(new.get(key)):
+            changes.add(("global", key))
+    for i, (a, b) in enumerate(zip(old["layers"], new["layers"])):
+        for key in set(a) | set(b):
+            if str(a.get(key)) != str(b.get(key)):
+                changes.add(("layer", i, key))
+    for a, b in zip(old["transformations"], new["transformations"]):
+        for key in ("name", "type", "parent"):
+            if a.get(key) != b.get(key):
+                return None
+        for key in set(a) | set(b):
+            if str(a.get(key)) != str(b.get(key)):
+                changes.add(("transformation", b["name"], key))
+    return changes
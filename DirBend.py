@@ -14,6 +14,8 @@ from LinearTransformation import *
 
 DIR = Enum('DIR', 'NEGY POSY NEGX POSX')#
 global MAX_EDGE_LENGTH
+# distance (in mm) up to which an outline point counts as lying on the baseline
+BASELINE_TOLERANCE = 1e-9
 
 
 class DirBend(Transformation):
@@ -56,7 +58,7 @@ class DirBend(Transformation):
             self.extLine = LineString((Point(minx, y0), Point(maxx, y1)))
 
         dists = [self.extLine.distance(Point(p)) for p in poly.exterior.coords]
-        distPoints = [(dists[i], poly.exterior.coords[i]) for i in range(len(poly.exterior.coords)) if dists[i] > 0]
+        distPoints = [(dists[i], poly.exterior.coords[i]) for i in range(len(poly.exterior.coords)) if dists[i] > BASELINE_TOLERANCE]
 
         points_sorted_by_distance = sorted(distPoints, key=lambda x: x[0])
         length = points_sorted_by_distance[0][0]
@@ -69,6 +71,7 @@ class DirBend(Transformation):
         self.z_angle = np.arctan((bx-ax)/(ay-by))
         print("Z_ANGLE: {}".format(np.rad2deg(self.z_angle)))
         self.boundaries_rot = affinity.rotate(poly, self.z_angle, origin=self.pivot, use_radians=True)
+        shapely.prepare(self.boundaries_rot)
 
         r = length / self.angle
         a = self.angle
@@ -76,6 +79,9 @@ class DirBend(Transformation):
         self.newTr[0] = cos(a), 0, -sin(a), -(self.pivot[0]+length) * cos(a) + self.pivot[0] + r * (sin(a))
         self.newTr[1] = 0, 1, 0, 0
         self.newTr[2] = sin(a), 0, cos(a), -(self.pivot[0]+length) * sin(a) + r * (1 - cos(a))
+        self.rot = rotation_z_affine(self.z_angle, self.pivot)
+        self.rot_back = rotation_z_affine(-self.z_angle, self.pivot)
+        self.residualAffine = compose_affine(self.rot_back, compose_affine(self.newTr, self.rot))
 
         self.baseline = baseline
         self.length = length
@@ -91,6 +97,10 @@ class DirBend(Transformation):
     def __str__(self):
         return "Tr.DirBend: [P={}; Res={}; angle={}; len={}; baseline={}; bounds={}]".format(self.prio, self.addResidual, self.angle, self.length, self.baseline, self.boundaries)
 
+    def __setstate__(self, state):
+        super().__setstate__(state)
+        shapely.prepare(self.boundaries_rot)
+
     def debugShow(self):
         def getPoints(obj):
             x = obj.coords.xy[0]
@@ -139,20 +149,36 @@ class DirBend(Transformation):
         ret.name = self.name + "-Res"
         return ret
 
-    def transformMesh(self, mesh):
-        print("--> Transforming a whole mesh now")
-        mesh.rotate_z(self.z_angle, rad=True, around=self.pivot)
-        points = mesh.points()
-        for pid, pt in enumerate(points):
-            self.parent.update_progress(pid, len(points))
-            vec = np.array([pt[0], pt[1], pt[2], 1])
-            vec = np.dot(self.getMatrixAt(pt), vec)
-            points[pid][0] = vec[0]
-            points[pid][1] = vec[1]
-            points[pid][2] = vec[2]
-        mesh.points(points)
-        mesh.rotate_z(-self.z_angle, rad=True, around=self.pivot)
-        return mesh
+    def transformPoints(self, points):
+        # Classifies all vertices at once in the rotated frame. Vertices outside the bend zone keep their position,
+        # the residual side gets the constant affine (rotation folded in) and only the vertices inside the zone
+        # are bent and rotated back.
+        points = np.asarray(points, dtype=float)
+        pts_rot = apply_affine(self.rot, points)
+        x = pts_rot[:, 0]
+        residual = x > (self.pivot[0] + self.length)
+        bend = ~residual & shapely.intersects_xy(self.boundaries_rot, x, pts_rot[:, 1])
+
+        ret = points.copy()
+        ret[residual] = apply_affine(self.residualAffine, points[residual])
+
+        z = pts_rot[bend, 2]
+        r = abs(self.length) / self.angle
+        a = np.abs(x[bend] - self.pivot[0]) / self.length * self.angle
+        bent = pts_rot[bend]
+        bent[:, 0] = -z * sin(a) + self.pivot[0] + r * sin(a)
+        bent[:, 2] = z * cos(a) + (1 - cos(a)) * r
+        ret[bend] = apply_affine(self.rot_back, bent)
+        return ret
+
+    def getBendRadius(self):
+        if self.angle == 0:
+            return None
+        return abs(self.length) / abs(self.angle)
+
+    def getBendDirection(self):
+        # the bend runs along x of the rotated frame
+        return np.cos(self.z_angle), -np.sin(self.z_angle)
 
     def getMatrixAt(self, pt):  #TODO
         x = pt[0]
@@ -1,3 +1,6 @@
+import concurrent.futures
+import threading
+
 from PyQt6 import QtCore
 from PyQt6.QtCore import QObject, QThread, pyqtSignal
 
@@ -7,14 +10,92 @@ from ZBend import *
 from LinearTransformation import *
 from FileParser import FileParser
 from RenderContainer import *
+from Progress import *
+from Tracing import start_tracing, stop_tracing, export_trace
+from MeshExport import export_result
+from VmapExport import export_vmap, get_vmap_pieces
+from Cancellation import CancellationToken, Cancelled
+
+
+# quiet time after the last request before queued jobs start, in ms
+DEBOUNCE_MS = 250
+# queued job kinds in the order they run, with the worker method doing the job
+JOBS = {"open": "parseFile", "parse": "parse", "update": "updateJob", "visualize": "visualize", "render": "render",
+        "export": "exportJob"}
+# pending jobs made redundant by another pending job
+SUPERSEDED = {"open": ("parse", "update", "visualize", "export"), "parse": ("visualize",), "update": ("visualize",)}
+# job kinds whose requests all run in turn instead of replacing each other
+APPENDED = ("export",)
+# running jobs whose result is outdated by a new request of another kind (it changes the parameters they work on)
+INVALIDATES = {"open": ("parse", "update", "visualize", "render"), "parse": ("visualize", "render"),
+               "update": ("visualize", "render")}
+# invalidated kinds that run again after the invalidating job; visualizing is part of the update job anyway
+RERUN = {"parse": ("render",), "update": ("render",)}
+
+
+class JobQueue:
+    # Latest request per job kind, shared by the GUI thread (submit) and the worker thread (take). A new request
+    # replaces the pending one of its kind and bumps the generation of the kind, so a running job can tell that its
+    # result is stale already. A request also outdates the jobs of the kinds it INVALIDATES that are running or
+    # taken already. Requests of APPENDED kinds are kept in order and never go stale.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.generations = {}
+        # per kind, the newest generation that is outdated
+        self.stale = {}
 
-import VMeshTools as vmt
+    def submit(self, kind, *args):
+        if kind not in JOBS:
+            raise ValueError("Unknown job '{}'".format(kind))
+        with self.lock:
+            generation = self.generations.get(kind, 0) + 1
+            self.generations[kind] = generation
+            if kind in APPENDED:
+                self.pending.setdefault(kind, []).append((generation, args))
+            else:
+                self.pending[kind] = [(generation, args)]
+            for other in INVALIDATES.get(kind, ()):
+                if other not in self.pending:
+                    self.stale[other] = self.generations.get(other, 0)
+        return generation
+
+    def take(self):
+        # all pending jobs as (kind, generation, args) in running order
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        for kind, superseded in SUPERSEDED.items():
+            if kind in pending:
+                for other in superseded:
+                    pending.pop(other, None)
+        return [(kind,) + job for kind in JOBS if kind in pending for job in pending[kind]]
+
+    def clear(self):
+        with self.lock:
+            self.pending.clear()
+
+    def is_current(self, kind, generation):
+        if kind in APPENDED:
+            return True
+        with self.lock:
+            return (self.generations.get(kind) == generation and kind not in self.pending and
+                    generation > self.stale.get(kind, 0))
 
 
 class FTLWorker(QtCore.QObject):
     def __init__(self, main):
         super().__init__()
         self.main = main
+        self.reporter = ProgressReporter([QtProgressSink(self.progress, self.status)])
+        # VMAP files are written in the background, one at a time
+        self.exportPool = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self.jobs = JobQueue()
+        # (kind, generation) and cancellation token of the running queued job
+        self.current = None
+        self.token = None
+        # created on the worker thread on first use
+        self.timer = None
+        self.jobRequested.connect(self.scheduleJobs)
         main.console("FTLWorker created.\n")
 
     progress = QtCore.pyqtSignal(int)
@@ -24,36 +105,95 @@ class FTLWorker(QtCore.QObject):
     visualizationFinished = QtCore.pyqtSignal()
     renderingFinished = QtCore.pyqtSignal()
     updatingFinished = QtCore.pyqtSignal()
+    exportFinished = QtCore.pyqtSignal(str)
+    jobRequested = QtCore.pyqtSignal()
+
+    def submitJob(self, kind, *args):
+        # Queues a job from any thread. Requests arriving within DEBOUNCE_MS of each other are coalesced and a request
+        # replaces the pending job of the same kind, so the job always works on the newest parameter state.
+        self.jobs.submit(kind, *args)
+        # a job outdated while running is repeated with the new parameters
+        current = self.current
+        if current is not None and current[0] in RERUN.get(kind, ()):
+            self.jobs.submit(current[0])
+        self.jobRequested.emit()
+
+    def scheduleJobs(self):
+        if self.timer is None:
+            self.timer = QtCore.QTimer()
+            self.timer.setSingleShot(True)
+            self.timer.timeout.connect(self.runJobs)
+        self.timer.start(DEBOUNCE_MS)
+
+    def runJobs(self):
+        for kind, generation, args in self.jobs.take():
+            if not self.jobs.is_current(kind, generation):
+                continue  # requested again meanwhile, the newer job runs next
+            self.current = (kind, generation)
+            self.token = CancellationToken()
+            if self.main.parser is not None:
+                self.main.parser.set_token(self.token)
+            try:
+                getattr(self, JOBS[kind])(*args)
+            except Cancelled:
+                self.reporter.finish("Cancelled.")
+                print("Job '{}' cancelled.".format(kind))
+                break
+            except Exception:
+                # levels left open by the failed job would skew the fractions and ETA of the next one
+                self.reporter.finish("Job '{}' failed.".format(kind))
+                raise
+            finally:
+                self.current = None
+                self.token = None
+                # calls outside of the queue must not inherit a cancelled token
+                if self.main.parser is not None:
+                    self.main.parser.set_token(CancellationToken())
+
+    def cancel(self):
+        # called directly from the GUI thread, the worker thread is busy with the job to be cancelled
+        self.jobs.clear()
+        token = self.token
+        if token is not None:
+            token.cancel()
+            self.reporter.notify("Cancelling...")
+
+    def isStale(self):
+        # True while a queued job runs whose result has been superseded by a newer request
+        return self.current is not None and not self.jobs.is_current(*self.current)
 
     def parseFile(self, file):
-        self.status.emit("Opening file...")
-        self.progress.emit(0)
+        self.reporter.notify("Opening file...", 0)
         main = self.main
-        main.parser = FileParser(file, main.rcFP, main.rcRender, True)
-        # main.parser.progress.connect(self.forwardProgress)
-        main.parser.progress.connect(self.progress)
-        main.parser.status.connect(self.status)
+        main.parser = FileParser(file, main.rcFP, main.rcRender, True, self.reporter)
+        if self.token is not None:
+            main.parser.set_token(self.token)
         self.parse(False)
-        self.fileOpened.emit()
+        if not self.isStale():
+            self.fileOpened.emit()
         print("File opened.")
 
     def updateModel(self):
         print("(Re)parsing...")
         main = self.main
-        main.parser.parse()
+        main.parser.update()
         # main.visualize()
-        self.status.emit("File parsed successfully.")
-        self.progress.emit(100)
+        self.reporter.finish("File parsed successfully.")
         print("(Re)parsed.")
 
+    def updateJob(self):
+        self.updateModel()
+        if not self.isStale():
+            self.visualize()
+
     def parse(self, signal=True):
         print("(Re)parsing...")
         main = self.main
-        main.parser.parse()
-        main.parser.calculate_assignments()
+        with self.reporter.task("Parsing and assigning", 2):
+            main.parser.parse()
+            main.parser.calculate_assignments()
         main.visualize()
-        self.status.emit("File parsed successfully.")
-        self.progress.emit(100)
+        self.reporter.finish("File parsed successfully.")
         if signal:
             self.parsingFinished.emit()
         print("(Re)parsed.")
@@ -61,35 +201,73 @@ class FTLWorker(QtCore.QObject):
     def visualize(self):
         print("Visualizing...")
         self.main.parser.visualize()
-        self.status.emit("View updated.")
-        self.progress.emit(100)
+        self.reporter.finish("View updated.")
         print("Visualisation finished.")
-        self.visualizationFinished.emit()
+        if not self.isStale():
+            self.visualizationFinished.emit()
         print("Visualized")
 
     def render(self):
         print("Rendering...")
-        self.main.parser.render()
-        self.status.emit("Rendering finished.")
-        self.progress.emit(100)
-        self.renderingFinished.emit()
+        with self.reporter.task("Rendering", 2):
+            self.main.parser.render()
+        self.reporter.finish("Rendering finished.")
+        if not self.isStale():
+            self.renderingFinished.emit()
         print("Rendered.")
 
     def updateParser(self):
         print("Updating assignments...")
-        self.status.emit("Transformations updated.")
-        self.progress.emit(100)
+        self.reporter.finish("Transformations updated.")
         self.updatingFinished.emit()
         print("Assignments updated.")
 
+    def setTracing(self, enabled):
+        if enabled:
+            start_tracing()
+            self.reporter.notify("Recording trace.")
+        else:
+            stop_tracing()
+            self.reporter.notify("Trace recording stopped.")
+
+    def exportTrace(self, filename: str):
+        count = export_trace(filename)
+        self.reporter.notify("Exported {} trace events to '{}'.".format(count, filename))
+
+    def exportJob(self, fmt, filename, per_layer=False):
+        # runs queued like the other jobs, transforming first if the result is not up to date
+        if fmt == "vmap":
+            self.exportFile_VMAP(filename)
+        else:
+            self.exportResult(filename, per_layer)
+
     def exportFile_VMAP(self, filename: str):
-        vmap = vmt.VMAPFileHandler(filename)
         print("Filename:", filename)
-        for i, layer in enumerate(self.main.parser.layers):
-            print(layer.name, layer.file)
-            grp = vmt.VMAPMeshGroup(vmap, "/VMAP/GEOMETRY/" + str(i+1))
-            grp.writeMesh_vedo(layer.mesh, layer.name)
+        pieces = get_vmap_pieces(self.getResult())
+        future = self.exportPool.submit(export_vmap, filename, pieces)
+        future.add_done_callback(lambda f: self.vmapExported(f, filename, len(pieces)))
+        self.reporter.notify("Exporting {} meshes to '{}'...".format(len(pieces), filename))
+
+    def vmapExported(self, future, filename, count):
+        # runs on the export thread, so only signals are used
+        if future.exception() is not None:
+            self.status.emit("VMAP export failed: {}".format(future.exception()))
+            return
+        self.status.emit("Exported {} meshes to '{}'.".format(count, filename))
+        self.exportFinished.emit(filename)
 
+    def getResult(self):
+        # transformer with the bent result, transforming first if needed
+        transformer = self.main.parser.transformer
+        if not transformer.assigned:
+            self.main.parser.calculate_assignments()
+        if not transformer.rendered:
+            with self.reporter.task("Rendering", 1):
+                transformer.start_transformation()
+        return transformer
 
-    def exportFile_STL(self, filename: str):
-        raise NotImplementedError("Not implemented yet.")
+    def exportResult(self, filename, per_layer=False):
+        files = export_result(self.getResult(), filename, per_layer)
+        for target, points, faces in files:
+            print("Exported {} triangles to '{}'".format(faces, target))
+        self.reporter.finish("Exported {} file(s).".format(len(files)))
@@ -1,4 +1,7 @@
+import copy
 import json
+import os
+import threading
 from ZBend import *
 from DirBend import *
 from Spiral import *
@@ -6,17 +9,24 @@ from ZBend import *
 from PyQt6 import QtCore
 from MatrixTransformer import *
 from MeshLayer import *
+from Progress import *
+from MeshCache import MeshCache
+from DependencyGraph import *
+from Tracing import traced
+from Cancellation import CancellationToken
 import vedo as v
 #from shapely import geometry
 from shapely.geometry import Point, Polygon, LineString, GeometryCollection
 
 
 class FileParser(QtCore.QObject):
-    def __init__(self, filename, rcFP=None, rcRender=None, showProgress=False):
+    def __init__(self, filename, rcFP=None, rcRender=None, showProgress=False, reporter=None):
         super().__init__()
         self.transformations = None
         self.meshes = None
         self.transformer = None
+        # project data the model was last built from; j_data is the live copy edited by the GUI
+        self.snapshot = None
         self.filename = filename
         debug("Reading data from file '{}'".format(filename))
         f = open(filename)
@@ -28,32 +38,61 @@ class FileParser(QtCore.QObject):
         self.mel_residual = self.j_data["mel_residual"]
         self.j_layers = self.j_data["layers"]
         self.j_transformations = self.j_data["transformations"]
+        # guards j_data, which the GUI edits while the worker copies it, see set_parameter()
+        self.lock = threading.Lock()
+        # project data of the running parse/update, copied from j_data when it starts
+        self.data = self.copy_project()
+        # number of worker processes for assignments and transformation; 0 uses all cores
+        self.workers = self.j_data.get("workers", 1) or os.cpu_count()
         self.layers = []
 
         self.rcFP = rcFP
         self.rcRender = rcRender
         self.showProgress = showProgress
+        self.meshCache = None
+        if self.j_data.get("cache", True):
+            try:
+                self.meshCache = MeshCache()
+            except OSError as e:
+                debug("Mesh cache disabled: {}".format(e))
+        if reporter is None:
+            reporter = ProgressReporter([QtProgressSink(self.progress, self.status)])
+        self.reporter = reporter
+        # handed to every transformer, see set_token()
+        self.token = CancellationToken()
 
     progress = QtCore.pyqtSignal(int)
     status = QtCore.pyqtSignal(str)
 
+    def set_parameter(self, item, key, value):
+        # changes a layer or transformation entry of j_data from another thread than the one parsing
+        with self.lock:
+            item[key] = value
+
+    def copy_project(self):
+        with self.lock:
+            return copy.deepcopy(self.j_data)
+
     #def updateParams(self):
 
 
-    def parse(self):
-        self.progress.emit(0)
+    @traced("FileParser.parse")
+    def parse(self, data=None):
+        self.data = self.copy_project() if data is None else data
+        self.reporter.begin("Parsing", 2)
 
-        debug("Found {} layers and {} transformations. Global MEL: [{}/{}/{}]".format(len(self.j_layers),
-                                                                                      len(self.j_transformations),
+        debug("Found {} layers and {} transformations. Global MEL: [{}/{}/{}]".format(len(self.data["layers"]),
+                                                                                      len(self.data["transformations"]),
                                                                                       self.mel, self.mel_trans,
                                                                                       self.mel_residual))
-        self.transformer = MatrixTransformer(self.rcFP, self.rcRender)
-        self.transformer.status.connect(self.status)
-        self.transformer.progress.connect(self.progress)
+        self.transformer = self.create_transformer()
         self.meshes = []
         self.transformations = []
+        self.layers = []
 
-        for i, layer in enumerate(self.j_layers):
+        self.reporter.begin("Loading layers", len(self.data["layers"]))
+        for i, layer in enumerate(self.data["layers"]):
+            self.reporter.step(i, "Loading layer {}/{}".format(i + 1, len(self.data["layers"])))
             layerObj = MeshLayer.get_from_JSON(layer, self, i)
             # mesh = v.load(layer["file"])
             # layerObj = MeshLayer(mesh, layer, self, i)
@@ -66,53 +105,177 @@ class FileParser(QtCore.QObject):
                                                                                                    layerObj.color,
                                                                                                    layer["file"]))
 
+        self.reporter.end()
         meshNumStr = "/".join([str(layer.mesh.npoints) for layer in self.transformer.layers])
 
         debug("Transformer created. Imported {} layers with {} points.".format(self.transformer.nlayers, meshNumStr))
 
         debug("\nAll layers imported. Reading transformations...")
+        self.add_transformations()
+
+        debug("\nDone parsing.\n\n")
+        self.snapshot = self.data
+        self.reporter.end()
 
-        for i, tr in enumerate(self.j_transformations):
-            if "color" in tr:
-                color = tr["color"]
+    def update(self):
+        # Re-runs only the pipeline stages depending on the parameters changed since the last parse/update.
+        # edits arriving meanwhile only change j_data and are picked up by the next update
+        data = self.copy_project()
+        if self.transformer is None or self.snapshot is None:
+            self.parse(data)
+            return
+        assigned = self.transformer.assigned
+        rendered = self.transformer.rendered
+        changes = diff_project(self.snapshot, data)
+        if changes is None:
+            debug("Project structure changed, rebuilding everything.")
+            self.parse(data)
+            self.recompute(assigned, rendered)
+            return
+        if not changes:
+            debug("No parameters changed.")
+            return
+
+        self.data = data
+        stages = build_pipeline_graph(data, changes).stages(changes)
+        debug("Changed parameters: {}\nStages to recompute: {}".format(sorted(map(str, changes)),
+                                                                         sorted(map(str, stages))))
+        self.reload_layers({stage[1] for stage in stages if stage[0] == LOAD})
+        if (ASSIGN,) in stages:
+            self.transformer = self.create_transformer()
+            for layer in self.layers:
+                self.transformer.add_layer(layer)
+            self.add_transformations()
+            self.recompute(assigned, rendered)
+        else:
+            old = self.transformer.transformations
+            self.transformer.layers = list(self.layers)
+            self.transformer.transformations = []
+            self.transformer.tolerance = self.get_tolerance()
+            self.add_transformations()
+            self.transplant(old, stages)
+            self.transformer.assigned = assigned
+            if rendered and (MERGE,) in stages:
+                self.transformer.start_transformation({stage[1] for stage in stages if stage[0] == TRANSFORM})
+                self.transformer.get_result_mesh()
+        self.snapshot = data
+
+    def recompute(self, assigned, rendered):
+        if assigned or rendered:
+            self.calculate_assignments()
+        if rendered:
+            self.render()
+
+    def reload_layers(self, layerIds):
+        layers = []
+        for i, data in enumerate(self.data["layers"]):
+            if i in layerIds or i >= len(self.layers):
+                layer = MeshLayer.get_from_JSON(data, self, i)
             else:
-                color = None
-            debug("  Found transformation #{} '{}' of type {} with priority {} and color '{}'".format(
-                len(self.transformer.transformations), tr["name"], tr["type"], tr["priority"], color))
-            if tr["type"] == "ZBend":
-                if tr["dir"] == "POSX":
-                    print("Found POSX")
-                    dir = DIR.POSX
-                elif tr["dir"] == "NEGX":
-                    dir = DIR.NEGX
-                elif tr["dir"] == "POSY":
-                    dir = DIR.POSY
-                elif tr["dir"] == "NEGY":
-                    dir = DIR.NEGY
-                else:
-                    raise ValueError("Direction of ZBend-Transformation not found: {}".format(tr["dir"]))
-                trans = ZBend(int(tr["xmin"]), int(tr["xmax"]), int(tr["ymin"]), int(tr["ymax"]), int(tr["angle"]), dir,
-                              name=tr["name"])
-                debug("  -> dir={};  angle={};  x = {}...{};  y = {}...{};".format(tr["dir"], tr["angle"], tr["xmin"],
-                                                                                   tr["xmax"], tr["ymin"], tr["ymax"]))
-            elif tr["type"] == "DirBend":
-
-                trans = DirBend(tr, name=tr["name"])
-                self.transformer.rcFP.add_debug("Debug_Trans", trans.debugShow(), True)
-
-            elif tr["type"] == "Spiral":
-                trans = Spiral(tr, name=tr["name"])
-                self.transformer.rcFP.add_debug("Debug_Trans", trans.debugShow(), True)
+                layer = MeshLayer(self.layers[i].mesh, data, self, i)
+                layer.meshKey = self.layers[i].meshKey
+            layers.append(layer)
+        self.layers = layers
 
+    def transplant(self, old, stages):
+        # hands the assignments and the still valid stage products of the old transformations to the new ones
+        previous = {tr.name: tr for tr in old}
+        for tr in self.transformer.transformations:
+            prev = previous.get(tr.name)
+            if prev is None:
+                continue
+            tr.meshes = prev.meshes
+            tr.layerIds = prev.layerIds
+            tr.scope = prev.scope
+            tr.fixed_footprint = prev.fixed_footprint
+            if tr.isResidual:
+                tr.mel = [self.layers[i].mel_residual for i in tr.layerIds]
             else:
-                raise TypeError("Unknown transformation type.")
-            trans.color = color
+                tr.mel = [self.layers[i].mel_trans for i in tr.layerIds]
+            if (SUBDIVIDE, tr.name) not in stages:
+                tr.preprocessed = prev.preprocessed
+            if (TRANSFORM, tr.name) not in stages:
+                tr.results = prev.results
+
+    def set_token(self, token):
+        # cancellation token for the following jobs
+        self.token = token
+        if self.transformer is not None:
+            self.transformer.set_token(token)
+
+    def create_transformer(self):
+        transformer = MatrixTransformer(self.rcFP, self.rcRender, self.reporter)
+        transformer.workers = self.workers
+        transformer.set_token(self.token)
+        if self.data.get("assignment_cache", True):
+            transformer.assignmentCache = self.meshCache
+        transformer.tolerance = self.get_tolerance()
+        transformer.partitioner = bool(self.data.get("partitioner", False))
+        transformer.reuse_partition = bool(self.data.get("reuse_partition", False))
+        if "debug" in self.data:
+            transformer.artifacts = DebugArtifacts(self.data["debug"].get("level", 0),
+                                                   self.data["debug"].get("directory"))
+            if "geometry" in self.data["debug"]:
+                transformer.debugGeometry = DebugGeometry(bool(self.data["debug"]["geometry"]),
+                                                          self.data["debug"].get("geometry_limit", 256) * 1024 ** 2)
+        return transformer
+
+    def get_tolerance(self):
+        # chordal tolerance of the adaptive refinement, None for the uniform one
+        if get_refinement(self.data) == "adaptive":
+            return self.data.get("tolerance", DEFAULT_TOLERANCE)
+        return None
+
+    def add_transformations(self):
+        self.reporter.begin("Reading transformations", len(self.data["transformations"]))
+        for i, tr in enumerate(self.data["transformations"]):
+            self.reporter.step(i)
+            trans = self.create_transformation(tr)
             debug("  - Adding Transformation {}".format(trans))
             # self.transformations.append(trans)
             self.transformer.add_transformation(trans)
+        self.reporter.end()
 
-        debug("\nDone parsing.\n\n")
-        self.progress.emit(100)
+    def create_transformation(self, tr):
+        if "color" in tr:
+            color = tr["color"]
+        else:
+            color = None
+        debug("  Found transformation #{} '{}' of type {} with priority {} and color '{}'".format(
+            len(self.transformer.transformations), tr["name"], tr["type"], tr["priority"], color))
+        if tr["type"] == "ZBend":
+            if tr["dir"] == "POSX":
+                print("Found POSX")
+                dir = DIR.POSX
+            elif tr["dir"] == "NEGX":
+                dir = DIR.NEGX
+            elif tr["dir"] == "POSY":
+                dir = DIR.POSY
+            elif tr["dir"] == "NEGY":
+                dir = DIR.NEGY
+            else:
+                raise ValueError("Direction of ZBend-Transformation not found: {}".format(tr["dir"]))
+            trans = ZBend(int(tr["xmin"]), int(tr["xmax"]), int(tr["ymin"]), int(tr["ymax"]), int(tr["angle"]), dir,
+                          name=tr["name"])
+            debug("  -> dir={};  angle={};  x = {}...{};  y = {}...{};".format(tr["dir"], tr["angle"], tr["xmin"],
+                                                                               tr["xmax"], tr["ymin"], tr["ymax"]))
+        elif tr["type"] == "DirBend":
+
+            trans = DirBend(tr, name=tr["name"])
+            self.transformer.rcFP.add_debug("Debug_Trans", trans.debugShow(), True)
+
+        elif tr["type"] == "Spiral":
+            # Spiral completes its point data in place; the project data stays untouched for re-creation
+            trans = Spiral(copy.deepcopy(tr), name=tr["name"])
+            self.transformer.rcFP.add_debug("Debug_Trans", trans.debugShow(), True)
+
+        else:
+            raise TypeError("Unknown transformation type.")
+        trans.color = color
+        if "parent" in tr:
+            trans.parentTransformation = self.get_transformation(tr["parent"])
+            debug("  -> nested into transformation '{}'".format(tr["parent"]))
+        return trans
 
     def __str__(self):
         pass
@@ -121,6 +284,12 @@ class FileParser(QtCore.QObject):
         idList = self.j_layers[:]["name"]
         return idList.index(name)
 
+    def get_transformation(self, name):
+        for tr in self.transformer.transformations:
+            if tr.name == name and not tr.isResidual:
+                return tr
+        raise ValueError("Parent transformation '{}' not found. It has to be defined before its children.".format(name))
+
     def calculate_assignments(self, onlybaselayer=False):
         self.transformer.calculate_assignments(onlybaselayer)
 
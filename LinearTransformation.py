@@ -9,7 +9,6 @@ class LinearTransformation(Transformation):
         # super().__init__(bounds, prio, not residual, name=name)
         super().__init__(bounds, prio, False)
         self.name = name
-        self.residual = False
         self.mat = mat
         self.boundaries = bounds
         # shapely.geometry.box(xmin, ymin, xmax, ymax)
@@ -31,18 +30,19 @@ class LinearTransformation(Transformation):
         if not pt.disjoint(self.boundaries):
             return True
 
-    def transformMesh(self, mesh):
-        mesh.rotate_z(self.z_angle, rad=True, around=self.pivot)
-        points = mesh.points()
-        for pid, pt in enumerate(points):
-            vec = np.array([pt[0], pt[1], pt[2], 1])
-            vec = np.dot(self.mat, vec)
-            points[pid][0] = vec[0]
-            points[pid][1] = vec[1]
-            points[pid][2] = vec[2]
-        mesh.points(points)
-        mesh.rotate_z(-self.z_angle, rad=True, around=self.pivot)
-        return mesh
-
     def getMatrixAt(self, pt):
         return self.mat
+
+    def getAffine(self):
+        # the z-rotation around the pivot is folded into a single affine
+        if not self.transformWholeMesh:
+            return self.mat
+        rot = rotation_z_affine(self.z_angle, self.pivot)
+        rot_back = rotation_z_affine(-self.z_angle, self.pivot)
+        return compose_affine(rot_back, compose_affine(self.mat, rot))
+
+    def transformPoints(self, points):
+        return apply_affine(self.getAffine(), points)
+
+    def transformChainPoints(self, points):
+        return apply_affine(compose_affine(self.getChainMatrix(), self.getAffine()), points)
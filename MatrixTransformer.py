@@ -1,6 +1,8 @@
+import concurrent.futures
 import vedo as v
 import vtk
 import numpy as np
+import shapely
 from PyQt6 import QtCore
 from PyQt6.QtCore import QObject, QThread, pyqtSignal
 
@@ -16,11 +18,21 @@ def debug(str):
 
 from Transformation import *
 from RenderContainer import *
+from Progress import *
+from DebugArtifacts import DebugArtifacts, DebugGeometry, Verbosity
+from Tracing import span, traced, current_span
+from MeshHandle import MeshHandle
+from Partitioner import partition_mesh, LayerPartition
+from Cancellation import CancellationToken, Cancelled, wait_cancellable, cancellable_pool
+from AssignmentCache import assignment_key, store_assignment, load_assignment
 
 
 class MatrixTransformer(QtCore.QObject):
-    def __init__(self, rcFP=None, rcRender=None):
+    def __init__(self, rcFP=None, rcRender=None, reporter=None):
         super().__init__()
+        if reporter is None:
+            reporter = ProgressReporter([QtProgressSink(self.progress, self.status)])
+        self.reporter = reporter
         if rcFP is None:
             rcFP = RenderContainer()
         elif type(rcFP) is v.Plotter:
@@ -37,9 +49,22 @@ class MatrixTransformer(QtCore.QObject):
         self.nlayers = 0
         self.transformations = []
         self.mel = None
-        self.debugOutput = []
-        self.fixed_scope = None
+        self.debugGeometry = DebugGeometry.from_env()
+        self.fixed_footprint = None
         self.fixed_mesh = []
+        self.workers = 1
+        self.tolerance = None
+        self.partitioner = False
+        # MeshCache for assignment results, keyed by the layer meshes and the zone geometry
+        self.assignmentCache = None
+        # checked by assignment and transformation; jobs that can be cancelled hand in their own token
+        self.token = CancellationToken()
+        # with reuse_partition, the stacked layers are assigned by the partition of the base layer
+        self.reuse_partition = False
+        self.layer_partition = None
+        self.assigned = False
+        self.rendered = False
+        self.artifacts = DebugArtifacts.from_env()
 
         self.fixedPts = []
         self.transformedPts = []
@@ -51,15 +76,21 @@ class MatrixTransformer(QtCore.QObject):
     progress = QtCore.pyqtSignal(int)
     status = QtCore.pyqtSignal(str)
 
-    def update_progress(self, cur, max):
-        self.progress.emit(int(cur / max * 100))
-
     def add_transformation(self, tr):
         trId = len(self.transformations)
         self.transformations.append(tr)
         tr.parent = self
+        tr.tolerance = self.tolerance
+        tr.token = self.token
+        if tr.parentTransformation is not None and not tr.isResidual:
+            if tr.parentTransformation.residual is None:
+                raise ValueError("Transformation '{}' cannot be nested into '{}' as it has no residual.".format(
+                    tr.name, tr.parentTransformation.name))
+            tr.parentTransformation.children.append(tr)
         if tr.addResidual:
             res = tr.getResidualTransformation()
+            res.parentTransformation = tr.parentTransformation
+            tr.residual = res
             debug("    - adding Residual {}".format(res))
             self.add_transformation(res)
 
@@ -80,8 +111,7 @@ class MatrixTransformer(QtCore.QObject):
 
     def visualize(self):
         debug("\n-------------------------\n-----  VISUALIZING  -----\n-------------------------")
-        self.status.emit("Visualizing...")
-        self.progress.emit(0)
+        self.reporter.begin("Visualizing", len(self.transformations))
         meshes = [l.mesh for l in self.layers]
         for layer in self.layers:
             self.rcFP.add_layer(layer.name, layer.mesh.clone().c("grey"))
@@ -90,8 +120,7 @@ class MatrixTransformer(QtCore.QObject):
             while trId < len(self.transformations):
                 tr = self.transformations[trId]
                 debug(tr)
-                self.status.emit("Visualizing Transformation {}/{}".format(trId, len(self.transformations)))
-                self.update_progress(trId + 1, len(self.transformations))
+                self.reporter.step(trId, "Visualizing Transformation {}/{}".format(trId + 1, len(self.transformations)))
                 debug("{} meshes found".format(len(tr.meshes)))
                 area = tr.getArea().extrude(3).z(-1.5).c("green").alpha(0.2)
                 self.rcFP.add_transformation(tr.name + "_outline", tr.getOutline().c("yellow7"))
@@ -110,152 +139,389 @@ class MatrixTransformer(QtCore.QObject):
             print("No Transformations found to visualize.")
         if len(self.fixed_mesh) > 0:
             self.rcRender.add_layer("Mesh_Fixed", v.merge(self.fixed_mesh).alpha(1).c("red"), True)
+        self.reporter.end()
+
+    def set_token(self, token):
+        self.token = token
+        for tr in self.transformations:
+            tr.token = token
 
     def calculate_assignments(self, onlybaselayer=False):
-        scope_residual = None
+        # a cancelled assignment leaves nothing behind, the next one starts from scratch
+        try:
+            self.assign_layers(onlybaselayer)
+        except Cancelled:
+            self.discard_assignments()
+            raise
+
+    def discard_assignments(self):
+        for tr in self.transformations:
+            tr.meshes = []
+            tr.mel = []
+            tr.layerIds = []
+            tr.scope = None
+            tr.fixed_footprint = None
+            tr.preprocessed = {}
+            tr.results = []
+        self.fixed_mesh = []
+        self.fixed_footprint = None
+        self.layer_partition = None
+        self.debugGeometry.clear()
+        self.assigned = False
+        self.rendered = False
+        self.reporter.finish("Cancelled.")
+
+    def assign_layers(self, onlybaselayer=False):
+        self.reporter.begin("Calculating assignments", 1 if onlybaselayer else len(self.layers))
         for layerId, layer in enumerate(self.layers):
+            # residual pieces of this layer; nested transformations cut their meshes from their parent's residual
+            residuals = {}
+            if layerId > 0 and (onlybaselayer or self.workers > 1):
+                break
+            self.token.check()
+            self.reporter.begin("Layer {}/{}".format(layerId + 1, len(self.layers)), len(self.transformations))
+            key = assignment_key(self, layerId)
+            if self.load_assignment(layerId, key):
+                self.reporter.end()
+                continue
 
             if layerId == 0:
                 debug("\nCalculating assignments. Layer #0 seen as substrate to generate transformation scopes...")
-                part = layer.mesh.clone()
+                # the layer mesh is only read while cutting, so it is shared instead of cloned
+                part = MeshHandle(layer.mesh, shared=True)
+                partition = partition_mesh(layer.mesh, self.transformations) if self.partitioner else None
                 trId = 0
                 while trId < len(self.transformations):
                     tr = self.transformations[trId]
+                    self.token.check()
                     debug("-> Transformation #{}: {}".format(trId, tr))
-                    self.status.emit("Calculating Assignments... Layer {}/{}, Transformation {}/{}".format(layerId + 1,
-                                                                                                           len(self.layers),
-                                                                                                           trId + 1,
-                                                                                                           len(self.transformations)))
-                    self.update_progress(layerId * len(self.layers) + trId, len(self.transformations))
+                    self.reporter.step(trId, "Transformation {}/{}".format(trId + 1, len(self.transformations)))
 
-                    outline = tr.getOutline()
-                    mesh_transformed, part = cut_with_line(part, outline, closed=True)
+                    if tr.parentTransformation is None:
+                        source = part.mesh if partition is None else partition.zones.get(trId)
+                    else:
+                        source = residuals.get(tr.parentTransformation.residual)
+                    if source is None:
+                        debug("    No geometry left for Transformation #{}, skipping.".format(trId))
+                        trId += 2 if tr.addResidual else 1
+                        continue
+
+                    # top-level zones were already cut out by the partitioner
+                    partitioned = partition is not None and tr.parentTransformation is None
+                    if partitioned:
+                        mesh_transformed, rest = source, None
+                    else:
+                        outline = tr.getOutline()
+                        with span("assign", transformation=tr.name, layer=layerId) as sp:
+                            sp.set_mesh(source)
+                            mesh_transformed, rest = cut_with_line(source, outline, closed=True)
 
-                    v.write(mesh_transformed, "_mesh_transformed.stl")
-                    v.write(part, "_part.stl")
+                    self.artifacts.write_mesh("{}_mesh_transformed.stl".format(tr.name), mesh_transformed)
+                    self.artifacts.write_mesh("{}_part.stl".format(tr.name), rest, Verbosity.VERBOSE)
 
                     ol_gop = tr.getOutlinePts()
                     scope_transformed = get_contour_scope(mesh_transformed)
                     tr.scope = scope_transformed
-                    tr.meshes.append(mesh_transformed.clone())
+                    tr.meshes.append(mesh_transformed)
                     tr.mel.append(layer.mel_trans)
-                    self.rcFP.add_transformation(tr.name + "_mesh", scope_transformed.clone().c("blue").alpha(0.2),
-                                                 False)
+                    tr.layerIds.append(layerId)
+                    self.rcFP.add_transformation(tr.name + "_mesh",
+                                                 scope_transformed.clone().c("blue").alpha(0.2), False)
 
                     fixedMeshes = []
                     residualMeshes = []
-                    split = part.split()
                     p0, p1 = tr.getBorderlinePts()
-                    self.rcFP.add_debug(tr.name + "_borderline", v.Line(tr.getBorderlinePts()).lw(2).c("red"), False)
-                    for prt in split:
-                        if prt.intersect_with_line(p0, p1).any():
-                            fixedMeshes.append(prt)
-                        else:
-                            residualMeshes.append(prt)
-                    part = v.merge(fixedMeshes)
+                    self.rcFP.add_debug(tr.name + "_borderline", v.Line(tr.getBorderlinePts()).lw(2).c("red"),
+                                        False)
+                    if partitioned:
+                        residualMeshes = partition.residuals[trId]
+                    else:
+                        for prt in rest.split():
+                            if prt.intersect_with_line(p0, p1).any():
+                                fixedMeshes.append(prt)
+                            else:
+                                residualMeshes.append(prt)
+                    fixed = v.merge(fixedMeshes)
 
                     #TODO: if fixedmesh is Null, there might be a problem with geometries
 
+                    if tr.parentTransformation is None:
+                        if not partitioned:
+                            part = MeshHandle(fixed)
+                    else:
+                        residuals[tr.parentTransformation.residual] = fixed
+                        if fixed is not None:
+                            tr.fixed_footprint = get_footprint(fixed)
+
                     if tr.addResidual and len(residualMeshes) > 0:
                         residual = v.merge(residualMeshes)
-                        scope_residual = get_contour_scope(residual)
-                        self.transformations[trId + 1].scope = scope_residual
-                        self.transformations[trId + 1].meshes.append(residual)
-                        self.transformations[trId + 1].mel.append(layer.mel_residual)
-
+                        tr.residual.scope = get_contour_scope(residual)
+                        residuals[tr.residual] = residual
 
                     if tr.addResidual:
-                        debug("    Skipping residual Transformation #{}: {}\n".format(trId + 1,
-                                                                                      self.transformations[trId + 1]))
+                        debug("    Skipping residual Transformation #{}: {}\n".format(
+                            trId + 1, self.transformations[trId + 1]))
                         trId += 2  # skip next transformation as we did it as a residual here
                     else:
                         trId += 1  # next transformation
 
-                self.fixed_mesh.append(part)
-                self.fixed_scope = get_contour_scope(part)
+                if partition is not None:
+                    part = MeshHandle(partition.fixed)
+                self.store_residuals(residuals, layerId)
+                self.fixed_footprint = get_footprint(part.mesh) if part.mesh is not None else None
+                self.fixed_mesh.append(part.mutable())
+                if self.reuse_partition:
+                    self.layer_partition = LayerPartition.from_transformations(self.transformations)
+                else:
+                    self.layer_partition = None
 
-                # TODO accessing fixed_scope causes error
+                self.store_assignment(layerId, key)
                 debug("Base layer done.\n")
+                self.reporter.end()
                 continue
-            if onlybaselayer:
-                break
             debug("Calculating {} assignments for layer #{}".format(len(self.transformations), layerId))
-
-            mesh_fixed = layer.mesh.clone()
-            trId = 0
-            while trId < len(self.transformations):
-                tr = self.transformations[trId]
-                debug("-> Transformation #{}: {}".format(trId, tr))
-
-                mesh_transformed, mesh_fixed, mesh_residual = split_with_transformation(self, mesh_fixed, tr)
-
-                self.debugOutput.append(mesh_transformed.clone().z(20).c("blue"))
-
-                debug("  -> Slice successful.")
-                tr.meshes.append(mesh_transformed.clone())
-                tr.mel.append(layer.mel_trans)
-                self.debugOutput.append(v.Line(tr.getBorderlinePts()).lw(2).c("red"))
-
-                if tr.addResidual and mesh_residual is not None and mesh_residual.npoints > 0:
-                    debug("  -> Adding residual....")
-                    self.transformations[trId + 1].meshes.append(mesh_residual)
-                    self.transformations[trId + 1].mel.append(layer.mel_residual)
-                    self.debugOutput.append(scope_residual.clone().c("green").alpha(0.2))
-
-                if tr.addResidual:
-                    debug("    Skipping residual Transformation #{}: {}\n".format(trId + 1,
-                                                                                  self.transformations[trId + 1]))
-                    trId += 2  # skip next transformation as we did it as a residual here
-                else:
-                    trId += 1  # next transformation
-
-                self.debugOutput.append(mesh_transformed.clone().c("blue"))
-
-                debug("    Transformation done.\n")
-            if mesh_fixed is not None:
-                self.fixed_mesh.append(mesh_fixed)
+            if self.layer_partition is not None:
+                pieces, residuals, mesh_fixed = self.layer_partition.apply(layer.mesh)
             else:
-                self.fixed_mesh.append(None)
+                pieces, residuals, mesh_fixed = assign_layer(MeshHandle(layer.mesh, shared=True),
+                                                             self.transformations, self.fixed_footprint, self.reporter,
+                                                             self.token)
+            self.collect_layer(layerId, pieces, residuals, mesh_fixed)
+            self.store_assignment(layerId, key)
+            self.reporter.end()
+
+        if self.workers > 1 and not onlybaselayer and len(self.layers) > 1:
+            self.calculate_assignments_parallel()
+        self.assigned = True
+        self.reporter.end()
+
+    def calculate_assignments_parallel(self):
+        # every non-base layer only depends on the base layer scopes, so the layers are spread over a process pool;
+        # meshes travel as point/face arrays
+        debug("Calculating assignments of {} layers on {} processes".format(len(self.layers) - 1, self.workers))
+        keys = {layerId: assignment_key(self, layerId) for layerId in range(1, len(self.layers))}
+        cached = {layerId: load_assignment(self.assignmentCache, key) for layerId, key in keys.items()
+                  if key is not None}
+        with cancellable_pool(concurrent.futures.ProcessPoolExecutor(max_workers=self.workers)) as pool:
+            futures = {}
+            for layerId, layer in enumerate(self.layers[1:], 1):
+                if cached.get(layerId) is not None:
+                    continue
+                points, faces = mesh_to_arrays(layer.mesh)
+                if self.layer_partition is not None:
+                    futures[layerId] = pool.submit(partition_layer_job, points, faces, self.layer_partition)
+                else:
+                    futures[layerId] = pool.submit(assign_layer_job, points, faces, self.transformations,
+                                                   self.fixed_footprint)
+            for future in wait_cancellable(futures.values(), self.token):
+                future.result()
+                self.reporter.step()
+            for layerId in range(1, len(self.layers)):
+                if layerId not in futures:
+                    debug("Loaded assignments of layer #{} from cache".format(layerId))
+                    data = cached[layerId]
+                    self.collect_layer(layerId, data["pieces"], data["residuals"], MeshHandle(data["fixed"]))
+                    continue
+                pieces, residuals, mesh_fixed = futures[layerId].result()
+                pieces = {trId: mesh_from_arrays(*arrays) for trId, arrays in pieces.items()}
+                residuals = {trId: mesh_from_arrays(*arrays) for trId, arrays in residuals.items()}
+                if mesh_fixed is not None:
+                    mesh_fixed = MeshHandle(mesh_from_arrays(*mesh_fixed))
+                self.collect_layer(layerId, pieces, residuals, mesh_fixed)
+                self.store_assignment(layerId, keys[layerId])
+
+    def load_assignment(self, layerId, key):
+        # restores a cached layer assignment; the base layer also brings back scopes and footprints
+        if key is None:
+            return False
+        data = load_assignment(self.assignmentCache, key)
+        if data is None:
+            return False
+        debug("Loaded assignments of layer #{} from cache".format(layerId))
+        self.collect_layer(layerId, data["pieces"], data["residuals"], MeshHandle(data["fixed"]))
+        if layerId > 0:
+            return True
+        for trId, scope in data["scopes"].items():
+            tr = self.transformations[trId]
+            tr.scope = scope
+            if not tr.isResidual:
+                self.rcFP.add_transformation(tr.name + "_mesh", scope.clone().c("blue").alpha(0.2), False)
+                self.rcFP.add_debug(tr.name + "_borderline", v.Line(tr.getBorderlinePts()).lw(2).c("red"), False)
+        for trId, footprint in data["footprints"].items():
+            self.transformations[trId].fixed_footprint = footprint
+        self.fixed_footprint = data["footprint"]
+        if self.reuse_partition:
+            self.layer_partition = LayerPartition.from_transformations(self.transformations)
+        else:
+            self.layer_partition = None
+        return True
+
+    def store_assignment(self, layerId, key):
+        if key is None:
+            return
+        pieces = {}
+        residuals = {}
+        for trId, tr in enumerate(self.transformations):
+            if layerId in tr.layerIds:
+                mesh = tr.meshes[tr.layerIds.index(layerId)]
+                if tr.isResidual:
+                    residuals[trId] = mesh
+                else:
+                    pieces[trId] = mesh
+        fixed = self.fixed_mesh[layerId] if layerId < len(self.fixed_mesh) else None
+        scopes = None
+        footprints = None
+        if layerId == 0:
+            scopes = {trId: tr.scope for trId, tr in enumerate(self.transformations) if tr.scope is not None}
+            footprints = {trId: tr.fixed_footprint for trId, tr in enumerate(self.transformations)
+                          if tr.fixed_footprint is not None}
+        try:
+            store_assignment(self.assignmentCache, key, pieces, residuals, fixed, scopes, footprints,
+                             self.fixed_footprint if layerId == 0 else None)
+        except OSError as e:
+            debug("Could not cache the assignments of layer #{}: {}".format(layerId, e))
+
+    def collect_layer(self, layerId, pieces, residuals, mesh_fixed):
+        layer = self.layers[layerId]
+        for trId, mesh_transformed in pieces.items():
+            tr = self.transformations[trId]
+            tr.meshes.append(mesh_transformed)
+            tr.mel.append(layer.mel_trans)
+            tr.layerIds.append(layerId)
+            self.add_debug_recipes(trId, len(tr.meshes) - 1, trId + 1 in residuals)
+        self.store_residuals({self.transformations[trId]: mesh for trId, mesh in residuals.items()}, layerId)
+        self.fixed_mesh.append(mesh_fixed.mutable() if mesh_fixed is not None else None)
+
+    def add_debug_recipes(self, trId, meshNum, residual=False):
+        # recipes look the meshes up when they are built, so they never keep stale stage products alive
+        if not self.debugGeometry.enabled:
+            return
+        tr = self.transformations[trId]
+        label = "{}_{}".format(tr.name, meshNum)
+        self.debugGeometry.add(label + "_lifted",
+                               lambda: self.transformations[trId].meshes[meshNum].clone().z(20).c("blue"))
+        self.debugGeometry.add(tr.name + "_borderline",
+                               lambda: v.Line(self.transformations[trId].getBorderlinePts()).lw(2).c("red"))
+        if residual and tr.addResidual:
+            self.debugGeometry.add(tr.name + "_residual_scope",
+                                   lambda: self.transformations[trId].residual.scope.clone().c("green").alpha(0.2))
+        self.debugGeometry.add(label, lambda: self.transformations[trId].meshes[meshNum].clone().c("blue"))
+
+    def add_debug_result(self, tr, meshNum):
+        if not self.debugGeometry.enabled:
+            return
+        trId = self.transformations.index(tr)
+        self.debugGeometry.add("{}_{}_result".format(tr.name, meshNum),
+                               lambda: self.transformations[trId].results[meshNum])
+
+    def store_residuals(self, residuals, layerId):
+        layer = self.layers[layerId]
+        for res, mesh in residuals.items():
+            if mesh is None or mesh.npoints == 0:
+                continue
+            res.meshes.append(mesh)
+            res.mel.append(layer.mel_residual)
+            res.layerIds.append(layerId)
 
     def getPointId(self, pt, meshNum):
         # return self.mesh[meshNum].closest_point(pt, 1, return_point_id=True)
         return self.layers[meshNum].mesh.closest_point(pt, 1, return_point_id=True)
 
-    def start_transformation(self):
-        for tr in self.transformations:
-            for meshNum in range(len(tr.meshes)):
-                mesh = tr.get_preprocessed_mesh(meshNum)
-                mats = []
-                if tr.transformWholeMesh:                     # Transformation implemented a method to  the whole transformation on its own
-                    mesh = tr.transformMesh(mesh)
+    def start_transformation(self, only=None):
+        # `only` limits the transformation stage to the given transformation names, the others keep their results
+        transformations = [tr for tr in self.transformations if only is None or tr.name in only]
+        try:
+            self.transform_meshes(transformations)
+        except Cancelled:
+            # finished preprocessing stays cached, partial results are dropped
+            for tr in transformations:
+                tr.results = []
+            self.rendered = False
+            self.reporter.finish("Cancelled.")
+            raise
+
+    def transform_meshes(self, transformations):
+        if self.workers > 1:
+            self.start_transformation_parallel(transformations)
+        else:
+            self.reporter.begin("Transforming", len(transformations))
+            for trId, tr in enumerate(transformations):
+                self.reporter.begin("{} ({}/{})".format(tr.name, trId + 1, len(transformations)), len(tr.meshes))
+                tr.results = []
+                for meshNum in range(len(tr.meshes)):
+                    self.token.check()
+                    points, faces = tr.get_preprocessed_arrays(meshNum)
+                    with span("transform", transformation=tr.name, vertices=len(points), triangles=len(faces)):
+                        mesh = mesh_from_arrays(tr.transformChainPoints(points), faces)
+                    tr.results.append(mesh)
+                    self.add_debug_result(tr, meshNum)
+                    self.reporter.step()
+                self.reporter.end()
+            self.reporter.end()
+        self.rendered = True
+
+    def start_transformation_parallel(self, transformations):
+        jobs = [(tr, meshNum) for tr in transformations for meshNum in range(len(tr.meshes))]
+        self.reporter.begin("Transforming", len(jobs))
+        debug("Transforming {} meshes on {} processes".format(len(jobs), self.workers))
+        for tr in transformations:
+            tr.results = [None] * len(tr.meshes)
+        with cancellable_pool(concurrent.futures.ProcessPoolExecutor(max_workers=self.workers)) as pool:
+            futures = {}
+            for tr, meshNum in jobs:
+                if meshNum in tr.preprocessed:
+                    points, faces = tr.preprocessed[meshNum]
+                    future = pool.submit(transform_points_job, tr, points)
                 else:
-                    points = mesh.points()
-                    for pid, pt in enumerate(points):
-                        self.update_progress(pid, len(points))
-                        vec = np.array([pt[0], pt[1], pt[2], 1])
-                        vec = np.dot(tr.getMatrixAt(pt), vec)
-                        points[pid][0] = vec[0]
-                        points[pid][1] = vec[1]
-                        points[pid][2] = vec[2]
-                    mesh.points(points)
-                tr.meshes[meshNum] = mesh
-                self.debugOutput.append(mesh)
+                    points, faces = mesh_to_arrays(tr.meshes[meshNum])
+                    future = pool.submit(transform_mesh_job, tr, points, faces, tr.mel[meshNum])
+                futures[future] = (tr, meshNum)
+            for future in wait_cancellable(futures, self.token):
+                tr, meshNum = futures[future]
+                result = future.result()
+                if len(result) == 3:
+                    points, faces, transformed = result
+                    tr.preprocessed[meshNum] = (points, faces)
+                else:
+                    transformed = result[0]
+                mesh = mesh_from_arrays(transformed, tr.preprocessed[meshNum][1])
+                tr.results[meshNum] = mesh
+                self.add_debug_result(tr, meshNum)
+                self.reporter.step()
+        self.reporter.end()
+
+    def get_result_pieces(self):
+        # the bent result as (layerId, name, mesh) pieces, for exports that do not need one merged mesh
+        for tr in self.transformations:
+            for meshNum, mesh in enumerate(tr.results):
+                yield tr.layerIds[meshNum], tr.name, mesh
+        for layerId, mesh in enumerate(self.fixed_mesh):
+            if mesh is not None:
+                yield layerId, "fixed", mesh
 
     def get_result_mesh(self):
-        for trId, tr in enumerate(self.transformations):
-            for meshNum, mesh in enumerate(tr.meshes):
-                print("--------> Got {}_{}-tr'ed".format(self.layers[meshNum].name, tr.name))
-                self.rcRender.add_layer("{}_{}-tr'ed".format(self.layers[meshNum].name, tr.name), mesh.alpha(1).c(self.layers[meshNum].color), True)
-
-        meshes = [v.merge(tr.meshes) for tr in self.transformations]
-        meshes = [e for e in meshes if e is not None]
-        meshes.append(v.merge(self.fixed_mesh))
-        ret = v.merge(meshes)
-        return ret
-
-
+        with span("get_result_mesh") as sp:
+            self.reporter.begin("Merging")
+            for trId, tr in enumerate(self.transformations):
+                for meshNum, mesh in enumerate(tr.results):
+                    layer = self.layers[tr.layerIds[meshNum]]
+                    print("--------> Got {}_{}-tr'ed".format(layer.name, tr.name))
+                    self.rcRender.add_layer("{}_{}-tr'ed".format(layer.name, tr.name), mesh.alpha(1).c(layer.color),
+                                            True)
+
+            meshes = [v.merge(tr.results) for tr in self.transformations]
+            meshes = [e for e in meshes if e is not None]
+            meshes.append(v.merge(self.fixed_mesh))
+            ret = v.merge(meshes)
+            sp.set_mesh(ret)
+            self.reporter.end()
+            return ret
+
+
+@traced("cut_with_line")
 def cut_with_line(mesh, points, invert=False, closed=True, residual=True):
-    mesh = mesh.clone()
+    sp = current_span()
+    sp.set_mesh(mesh)
     pplane = vtk.vtkPolyPlane()
     if isinstance(points, v.Points):
         points = points.points().tolist()
@@ -299,42 +565,111 @@ def cut_with_line(mesh, points, invert=False, closed=True, residual=True):
         cpoly.GetPointData().SetActiveScalars(currentscals)
         vis = mesh.mapper().GetScalarVisibility()
 
-    if mesh.GetIsIdentity() or cpoly.GetNumberOfPoints() == 0:
-        mesh._update(cpoly)
-    else:
-        # bring the underlying polydata to where _data is
-        M = vtk.vtkMatrix4x4()
-        M.DeepCopy(mesh.GetMatrix())
-        M.Invert()
-        tr = vtk.vtkTransform()
-        tr.SetMatrix(M)
-        tf = vtk.vtkTransformPolyDataFilter()
-        tf.SetTransform(tr)
-        tf.SetInputData(cpoly)
-        tf.Update()
-        mesh._update(tf.GetOutput())
-
-    mesh.pointdata.remove("SignedDistances")
-    mesh.mapper().SetScalarVisibility(vis)
+    # the input stays untouched; both outputs are new meshes in world coordinates with the input's appearance
+    inside = v.Mesh(cpoly)
+    inside.property = vtk.vtkProperty()
+    inside.property.DeepCopy(mesh.property)
+    inside.SetProperty(inside.property)
+    inside.pointdata.remove("SignedDistances")
+    inside.mapper().SetScalarVisibility(vis)
     cutoff = v.Mesh(kpoly)
     cutoff.property = vtk.vtkProperty()
     cutoff.property.DeepCopy(mesh.property)
-    cutoff.property.DeepCopy(mesh.property)
     cutoff.SetProperty(cutoff.property)
 
-    return mesh, cutoff
+    sp.set_mesh(inside, "inside_")
+    sp.set_mesh(cutoff, "outside_")
+    return inside, cutoff
+
+
+def assign_layer(mesh, transformations, fixed_footprint, reporter=None, token=None):
+    # Assignments of a non-base layer given as MeshHandle. Returns the transformed pieces and the residual pieces, both
+    # by index into `transformations`, and the handle of the remaining fixed mesh. Runs in worker processes as well,
+    # so it must not touch the transformer.
+    index = {id(tr): trId for trId, tr in enumerate(transformations)}
+    pieces = {}
+    residuals = {}
+    mesh_fixed = mesh
+    trId = 0
+    while trId < len(transformations):
+        tr = transformations[trId]
+        if token is not None:
+            token.check()
+        debug("-> Transformation #{}: {}".format(trId, tr))
+        if reporter is not None:
+            reporter.step(trId, "Transformation {}/{}".format(trId + 1, len(transformations)))
+
+        if tr.parentTransformation is None:
+            source = mesh_fixed.mesh
+            footprint = fixed_footprint
+        else:
+            source = residuals.get(index[id(tr.parentTransformation.residual)])
+            footprint = tr.fixed_footprint
+        if source is None or footprint is None:
+            debug("    No geometry left for Transformation #{}, skipping.".format(trId))
+            trId += 2 if tr.addResidual else 1
+            continue
+
+        with span("assign", transformation=tr.name) as sp:
+            sp.set_mesh(source)
+            mesh_transformed, fixed, mesh_residual = split_with_transformation(source, tr, footprint)
+        if tr.parentTransformation is None:
+            mesh_fixed = MeshHandle(fixed)
+        else:
+            residuals[index[id(tr.parentTransformation.residual)]] = fixed
+        debug("  -> Slice successful.")
+        pieces[trId] = mesh_transformed
 
+        if tr.addResidual and mesh_residual is not None and mesh_residual.npoints > 0:
+            debug("  -> Adding residual....")
+            residuals[trId + 1] = mesh_residual
 
-def split_with_transformation(self, mesh, tr):
-    mesh_transformed, part = cut_with_line(mesh.clone(), tr.getOutline())
+        if tr.addResidual:
+            debug("    Skipping residual Transformation #{}: {}\n".format(trId + 1, transformations[trId + 1]))
+            trId += 2  # skip next transformation as we did it as a residual here
+        else:
+            trId += 1  # next transformation
+        debug("    Transformation done.\n")
+    residuals = {trId: mesh for trId, mesh in residuals.items() if mesh is not None and mesh.npoints > 0}
+    return pieces, residuals, mesh_fixed
+
+
+def assign_layer_job(points, faces, transformations, fixed_footprint):
+    return layer_to_arrays(*assign_layer(MeshHandle(mesh_from_arrays(points, faces)), transformations,
+                                         fixed_footprint))
+
+
+def partition_layer_job(points, faces, layer_partition):
+    return layer_to_arrays(*layer_partition.apply(mesh_from_arrays(points, faces)))
+
+
+def layer_to_arrays(pieces, residuals, mesh_fixed):
+    pieces = {trId: mesh_to_arrays(mesh) for trId, mesh in pieces.items()}
+    residuals = {trId: mesh_to_arrays(mesh) for trId, mesh in residuals.items()}
+    if mesh_fixed.mesh is not None:
+        mesh_fixed = mesh_to_arrays(mesh_fixed.mesh)
+    else:
+        mesh_fixed = None
+    return pieces, residuals, mesh_fixed
+
+
+def transform_mesh_job(tr, points, faces, mel):
+    points, faces = mesh_to_arrays(tr.preprocess_mesh(mesh_from_arrays(points, faces), mel))
+    return points, faces, tr.transformChainPoints(points)
+
+
+def transform_points_job(tr, points):
+    return (tr.transformChainPoints(points),)
+
+
+def split_with_transformation(mesh, tr, footprint):
+    mesh_transformed, part = cut_with_line(mesh, tr.getOutline())
     fixedMeshes = []
     residualMeshes = []
     split = part.split()
     debug("  -> Splitting {} parts...".format(len(split)))
     for prt in split:
-        inter = len(self.fixed_scope.inside_points(prt.points()).points())
-        # debug("    Intersecting points: {}".format(inter))                  # TODO: Check for bounding box intersections
-        if inter:
+        if in_footprint(footprint, prt.points()):
             fixedMeshes.append(prt)
         else:
             residualMeshes.append(prt)
@@ -344,6 +679,40 @@ def split_with_transformation(self, mesh, tr):
     return mesh_transformed, mesh_fixed, mesh_residual
 
 
+def get_footprint(mesh):
+    # 2D outline of a mesh as the union of its triangles projected onto the xy plane, prepared for point queries
+    points, faces = mesh_to_arrays(mesh)
+    tris = points[faces][:, :, :2]
+    e1 = tris[:, 1] - tris[:, 0]
+    e2 = tris[:, 2] - tris[:, 0]
+    area = e1[:, 0] * e2[:, 1] - e1[:, 1] * e2[:, 0]
+    # upward facing triangles cover the footprint of a closed mesh; flat sheets might only face down
+    top = tris[area > 1e-12]
+    if len(top) == 0:
+        top = tris[area < -1e-12]
+    if len(top) == 0:
+        return None
+    footprint = shapely.union_all(shapely.polygons(np.concatenate([top, top[:, :1]], axis=1)))
+    shapely.prepare(footprint)
+    return footprint
+
+
+def in_footprint(footprint, points, samples=16):
+    # a part is fixed if it overlaps the footprint; after the bounding box check a handful of its points decide
+    points = np.asarray(points)
+    if len(points) == 0:
+        return False
+    minx, miny, maxx, maxy = footprint.bounds
+    pmin = points[:, :2].min(axis=0)
+    pmax = points[:, :2].max(axis=0)
+    if pmax[0] < minx or pmin[0] > maxx or pmax[1] < miny or pmin[1] > maxy:
+        return False
+    if len(points) > samples:
+        points = points[np.linspace(0, len(points) - 1, samples).astype(int)]
+    shapely.prepare(footprint)
+    return bool(shapely.intersects_xy(footprint, points[:, 0], points[:, 1]).any())
+
+
 def get_contour_scope(mesh):
     newMesh = mesh.clone()
     newMesh.clean()
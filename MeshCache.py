@@ -0,0 +1,108 @@
+import hashlib
+import os
+import tempfile
+import zipfile
+import numpy as np
+
+CACHE_VERSION = 1
+
+
+def get_cache_dir():
+    return os.environ.get("FTL_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "ftl"))
+
+
+class MeshCache:
+    # Content-addressed store for processed meshes (points + faces). Entries are written to a temporary file and
+    # renamed into place, so several processes can share one directory. The mtime of an entry is its last use and
+    # drives the LRU eviction once the directory grows beyond max_size bytes.
+
+    def __init__(self, directory=None, max_size=2 * 1024 ** 3, suffix=".npz"):
+        if directory is None:
+            directory = os.path.join(get_cache_dir(), "meshes")
+        self.directory = directory
+        self.max_size = max_size
+        self.suffix = suffix
+        self.digests = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def file_digest(self, filename):
+        # hashing is skipped while path, size and mtime of the file did not change
+        stat = os.stat(filename)
+        signature = (os.path.abspath(filename), stat.st_size, stat.st_mtime_ns)
+        if signature in self.digests:
+            return self.digests[signature]
+        digest = hashlib.sha256()
+        with open(filename, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        self.digests[signature] = digest.hexdigest()
+        return self.digests[signature]
+
+    def key(self, filename, **params):
+        digest = hashlib.sha256()
+        digest.update(self.file_digest(filename).encode())
+        digest.update(repr(sorted(params.items())).encode())
+        digest.update(str(CACHE_VERSION).encode())
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + self.suffix)
+
+    def load(self, key):
+        path = self.path(key)
+        try:
+            with np.load(path) as data:
+                ret = {name: data[name] for name in data.files}
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return ret
+
+    def store(self, key, **arrays):
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, **arrays)
+            os.replace(tmp, self.path(key))
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        self.evict()
+
+    def load_mesh(self, key):
+        data = self.load(key)
+        if data is None or "points" not in data or "faces" not in data:
+            return None
+        return data["points"], data["faces"]
+
+    def store_mesh(self, key, points, faces):
+        points = np.asarray(points, dtype=np.float32)
+        faces = np.asarray(faces)
+        if faces.size == 0 or faces.max() < np.iinfo(np.int32).max:
+            faces = faces.astype(np.int32)
+        self.store(key, points=points, faces=faces)
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(self.suffix):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(entry[1] for entry in entries)
+        for mtime, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
@@ -0,0 +1,148 @@
+import os
+import numpy as np
+
+from StlFile import STL_RECORD, STL_HEADER
+from Tracing import span
+
+EXPORT_FORMATS = ("stl", "ply")
+# triangles converted per write, bounds the temporary buffers of large pieces
+CHUNK_SIZE = 1 << 20
+
+PLY_FACE = np.dtype([("count", "u1"), ("ids", "<i4", (3,))])
+
+
+def get_format(filename):
+    fmt = os.path.splitext(filename)[1][1:].lower()
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError("Unknown export format '{}', expecting one of {}".format(fmt, ", ".join(EXPORT_FORMATS)))
+    return fmt
+
+
+def get_arrays(mesh):
+    return np.asarray(mesh.points(), dtype=np.float32), np.asarray(mesh.faces(), dtype=np.int64)
+
+
+class StlWriter:
+    # Binary STL file written piece by piece; the triangle count in the header is filled in on close.
+    def __init__(self, filename, header=b"FTL export"):
+        self.file = open(filename, "wb")
+        self.file.write(header[:STL_HEADER].ljust(STL_HEADER, b" "))
+        self.file.write(np.zeros(1, dtype="<u4").tobytes())
+        self.count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def write(self, points, faces):
+        for start in range(0, len(faces), CHUNK_SIZE):
+            tris = points[faces[start:start + CHUNK_SIZE]]
+            normals = np.cross(tris[:, 1] - tris[:, 0], tris[:, 2] - tris[:, 0])
+            length = np.linalg.norm(normals, axis=1, keepdims=True)
+            records = np.zeros(len(tris), dtype=STL_RECORD)
+            records["normal"] = normals / np.where(length > 0, length, 1)
+            records["vertices"] = tris
+            self.file.write(records.tobytes())
+            self.count += len(tris)
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.file.seek(STL_HEADER)
+        self.file.write(np.array([self.count], dtype="<u4").tobytes())
+        self.file.close()
+
+
+class PlyWriter:
+    # Binary PLY file; the header needs the final counts, so all points are written first and then all faces.
+    def __init__(self, filename, npoints, nfaces):
+        self.npoints = npoints
+        self.nfaces = nfaces
+        self.writtenPoints = 0
+        self.writtenFaces = 0
+        # point offset of the next piece whose faces are written
+        self.offset = 0
+        self.file = open(filename, "wb")
+        self.file.write("ply\nformat binary_little_endian 1.0\ncomment FTL export\n"
+                        "element vertex {}\nproperty float x\nproperty float y\nproperty float z\n"
+                        "element face {}\nproperty list uchar int vertex_indices\nend_header\n"
+                        .format(npoints, nfaces).encode("ascii"))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(exc_type is None)
+        return False
+
+    def write_points(self, points):
+        if self.writtenFaces > 0:
+            raise ValueError("PLY points have to be written before the faces")
+        self.file.write(np.ascontiguousarray(points, dtype="<f4").tobytes())
+        self.writtenPoints += len(points)
+
+    def write_faces(self, faces, npoints):
+        # faces of the next piece, indexed into its own `npoints` points
+        for start in range(0, len(faces), CHUNK_SIZE):
+            chunk = faces[start:start + CHUNK_SIZE]
+            records = np.empty(len(chunk), dtype=PLY_FACE)
+            records["count"] = 3
+            records["ids"] = chunk + self.offset
+            self.file.write(records.tobytes())
+            self.writtenFaces += len(chunk)
+        self.offset += npoints
+
+    def close(self, check=True):
+        if self.file.closed:
+            return
+        self.file.close()
+        if check and (self.writtenPoints != self.npoints or self.writtenFaces != self.nfaces):
+            raise ValueError("PLY file announced {}/{} points/faces, but {}/{} were written".format(
+                self.npoints, self.nfaces, self.writtenPoints, self.writtenFaces))
+
+
+def write_meshes(filename, meshes):
+    # Streams the meshes into one STL or PLY file without merging them; only one piece is converted at a time.
+    # Returns the number of written points and triangles.
+    fmt = get_format(filename)
+    npoints = 0
+    nfaces = 0
+    with span("write_meshes", file=filename, pieces=len(meshes)) as sp:
+        if fmt == "stl":
+            with StlWriter(filename) as writer:
+                for mesh in meshes:
+                    points, faces = get_arrays(mesh)
+                    writer.write(points, faces)
+                    npoints += len(points)
+            nfaces = writer.count
+        else:
+            npoints = sum(mesh.npoints for mesh in meshes)
+            nfaces = sum(mesh.ncells for mesh in meshes)
+            with PlyWriter(filename, npoints, nfaces) as writer:
+                for mesh in meshes:
+                    writer.write_points(get_arrays(mesh)[0])
+                for mesh in meshes:
+                    faces = np.asarray(mesh.faces(), dtype=np.int64)
+                    writer.write_faces(faces, mesh.npoints)
+        sp.set(vertices=npoints, triangles=nfaces)
+    return npoints, nfaces
+
+
+def export_result(transformer, filename, per_layer=False):
+    # Writes the bent result of a transformer, either into one file or into <name>_<layer>.<ext> per layer.
+    # Returns the written files with their point and triangle counts.
+    pieces = [piece for piece in transformer.get_result_pieces() if piece[2] is not None and piece[2].ncells > 0]
+    if not per_layer:
+        return [(filename,) + write_meshes(filename, [mesh for layerId, name, mesh in pieces])]
+    base, ext = os.path.splitext(filename)
+    ret = []
+    for layerId, layer in enumerate(transformer.layers):
+        meshes = [mesh for pieceLayer, name, mesh in pieces if pieceLayer == layerId]
+        if not meshes:
+            continue
+        target = "{}_{}{}".format(base, layer.name, ext)
+        ret.append((target,) + write_meshes(target, meshes))
+    return ret
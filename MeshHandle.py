@@ -0,0 +1,13 @@
+class MeshHandle:
+    # Reference to a vedo mesh that may belong to someone else, like the mesh of a layer (shared=True). `mesh` may be
+    # read freely but must not be changed in place; mutable() returns a mesh that may, cloning a shared one once.
+
+    def __init__(self, mesh, shared=False):
+        self.mesh = mesh
+        self.shared = shared
+
+    def mutable(self):
+        if self.mesh is not None and self.shared:
+            self.mesh = self.mesh.clone()
+            self.shared = False
+        return self.mesh
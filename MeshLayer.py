@@ -6,6 +6,8 @@ from MatrixTransformer import *
 from enum import Enum
 import copy
 from Transformation import *
+from Tracing import span
+from StlFile import read_stl
 
 
 class MeshLayer:
@@ -20,28 +22,29 @@ class MeshLayer:
             self.layer_id = parser.get_layer_id(self.name)
         self.layer_id = id
         self.mesh = mesh
+        self.meshKey = None
 
         debug("Created layer '{}' with id #{}".format(self.name, self.layer_id))
 
         if data["mel"] is None:
-            if parser.j_data["mel"] is None:
+            if parser.data["mel"] is None:
                 raise Exception("No MEL specified.")
             else:
-                self.mel = parser.j_data["mel"]
+                self.mel = parser.data["mel"]
         else:
             self.mel = data["mel"]
         if data["mel_trans"] is None:
-            if parser.j_data["mel_trans"] is None:
+            if parser.data["mel_trans"] is None:
                 raise Exception("No MEL_TRANS specified.")
             else:
-                self.mel_trans = parser.j_data["mel_trans"]
+                self.mel_trans = parser.data["mel_trans"]
         else:
             self.mel_trans = data["mel_trans"]
         if data["mel_residual"] is None:
-            if parser.j_data["mel_residual"] is None:
+            if parser.data["mel_residual"] is None:
                 raise Exception("No MEL_RESIDUAL specified.")
             else:
-                self.mel_residual = parser.j_data["mel_residual"]
+                self.mel_residual = parser.data["mel_residual"]
         else:
             self.mel_residual = data["mel_residual"]
 
@@ -51,6 +54,54 @@ class MeshLayer:
 
     @classmethod
     def get_from_JSON(cls, data, parser=None, id=None):
-        mesh = v.load(data["file"]).subdivide(0, 2, mel=2).clean()
+        with span("MeshLayer.get_from_JSON", file=data["file"]) as sp:
+            cache = getattr(parser, "meshCache", None)
+            params = get_load_params(parser)
+            key = None
+            if cache is None:
+                mesh = load_layer_mesh(data["file"], params)
+            else:
+                key = cache.key(data["file"], **params)
+                arrays = cache.load_mesh(key)
+                if arrays is None:
+                    mesh = load_layer_mesh(data["file"], params)
+                    cache.store_mesh(key, *mesh_to_arrays(mesh))
+                else:
+                    debug("Loaded '{}' from mesh cache".format(data["file"]))
+                    mesh = mesh_from_arrays(*arrays)
+            sp.set_mesh(mesh)
         inst = cls(mesh, data, parser, id)
+        inst.meshKey = key
         return inst
+
+
+# parameters of the preprocessing done on load; part of the mesh cache key
+LOAD_PARAMS = {"subdivide": (0, 2), "mel": 2, "clean": True, "reader": "native"}
+# adaptive refinement only subdivides the pieces inside the bend zones later on
+ADAPTIVE_LOAD_PARAMS = {"subdivide": None, "clean": True, "reader": "native"}
+REFINEMENTS = ("uniform", "adaptive")
+DEFAULT_TOLERANCE = 0.01
+
+
+def get_refinement(j_data):
+    refinement = j_data.get("refinement", "uniform")
+    if refinement not in REFINEMENTS:
+        raise ValueError("Unknown refinement '{}', expecting one of {}".format(refinement, ", ".join(REFINEMENTS)))
+    return refinement
+
+
+def get_load_params(parser):
+    if parser is not None and get_refinement(parser.data) == "adaptive":
+        return ADAPTIVE_LOAD_PARAMS
+    return LOAD_PARAMS
+
+
+def load_layer_mesh(filename, params=LOAD_PARAMS):
+    # STL files are mapped and welded by our own reader, everything else goes through vedo
+    if params.get("reader") == "native" and filename.lower().endswith(".stl"):
+        mesh = mesh_from_arrays(*read_stl(filename))
+    else:
+        mesh = v.load(filename)
+    if params["subdivide"] is not None:
+        mesh.subdivide(*params["subdivide"], mel=params["mel"])
+    return mesh.clean()
@@ -0,0 +1,211 @@
+import numpy as np
+import shapely
+import vtk
+import vedo as v
+from vtk.util.numpy_support import vtk_to_numpy
+
+from Transformation import mesh_to_arrays, mesh_from_arrays
+from Tracing import span
+from MeshHandle import MeshHandle
+
+# distance (in mm) up to which a vertex counts as lying on a zone outline or borderline
+SEAM_TOLERANCE = 1e-4
+
+
+class Partition:
+    # Result of partitioning a layer by the top-level transformations, keyed by transformation index: the zone mesh,
+    # the residual meshes and the fixed mesh that is left over.
+    def __init__(self):
+        self.zones = {}
+        self.residuals = {}
+        self.fixed = None
+
+
+def submesh(points, faces):
+    if len(faces) == 0:
+        return None
+    used, remap = np.unique(faces, return_inverse=True)
+    return mesh_from_arrays(points[used], remap.reshape(faces.shape))
+
+
+def weld(meshes):
+    meshes = [mesh for mesh in meshes if mesh is not None and mesh.ncells > 0]
+    if not meshes:
+        return None
+    return v.merge(meshes).clean()
+
+
+def label_vertices(points, regions, tree=None):
+    # index of the first region containing each vertex, -1 outside of all regions
+    if tree is None:
+        tree = shapely.STRtree(regions)
+    vertexIds, regionIds = tree.query(shapely.points(points[:, 0], points[:, 1]), predicate="intersects")
+    labels = np.full(len(points), len(regions), dtype=np.int64)
+    np.minimum.at(labels, vertexIds, regionIds)
+    labels[labels == len(regions)] = -1
+    return labels
+
+
+def cut_regions(mesh, regions, outlines, tree=None):
+    # Cuts all regions out of a mesh at once. Triangles with all vertices in one region are taken as a whole, only the
+    # ones straddling an outline are clipped along the outline points of the region. Returns the mesh of every region
+    # (None if empty) and the rest.
+    from MatrixTransformer import cut_with_line
+
+    with span("cut_regions", regions=len(regions)) as sp:
+        points, faces = mesh_to_arrays(mesh)
+        labels = label_vertices(points, regions, tree)[faces]
+        uniform = (labels[:, 0] == labels[:, 1]) & (labels[:, 1] == labels[:, 2])
+        sp.set(straddling=int(len(faces) - uniform.sum()))
+
+        pieces = {region: [submesh(points, faces[uniform & (labels[:, 0] == region)])]
+                  for region in range(-1, len(regions))}
+        straddling = submesh(points, faces[~uniform])
+        for region in np.unique(labels[~uniform]):
+            if region < 0 or straddling is None or straddling.ncells == 0:
+                continue
+            inside, straddling = cut_with_line(straddling, outlines[region])
+            pieces[region].append(inside)
+        pieces[-1].append(straddling)
+        return [weld(pieces[region]) for region in range(len(regions))], weld(pieces[-1])
+
+
+def label_components(mesh):
+    conn = vtk.vtkPolyDataConnectivityFilter()
+    conn.SetInputData(mesh.polydata())
+    conn.SetExtractionModeToAllRegions()
+    conn.ColorRegionsOn()
+    conn.Update()
+    out = conn.GetOutput()
+    points = vtk_to_numpy(out.GetPoints().GetData()).astype(float)
+    faces = vtk_to_numpy(out.GetPolys().GetData()).reshape(-1, 4)[:, 1:].astype(np.int64)
+    pointRegions = vtk_to_numpy(out.GetPointData().GetArray("RegionId"))
+    # not every VTK version colors the cells as well; all vertices of a triangle share its region
+    cellRegions = pointRegions[faces[:, 0]]
+    return points, faces, pointRegions, cellRegions, conn.GetNumberOfExtractedRegions()
+
+
+def near_boundary(geometry, points):
+    # ids of the points within SEAM_TOLERANCE of the outline of `geometry`
+    minx, miny, maxx, maxy = geometry.bounds
+    candidates = np.nonzero((points[:, 0] >= minx - SEAM_TOLERANCE) & (points[:, 0] <= maxx + SEAM_TOLERANCE) &
+                            (points[:, 1] >= miny - SEAM_TOLERANCE) & (points[:, 1] <= maxy + SEAM_TOLERANCE))[0]
+    if len(candidates) == 0:
+        return candidates
+    hits = shapely.dwithin(geometry.boundary if geometry.geom_type == "Polygon" else geometry,
+                           shapely.points(points[candidates, 0], points[candidates, 1]), SEAM_TOLERANCE)
+    return candidates[hits]
+
+
+def partition_mesh(mesh, transformations):
+    # Splits a layer into the zones of all top-level transformations in a single pass. Vertices are labelled through
+    # an STR tree of the outlines, triangles with one label go to their zone (or the remaining mesh) as a whole and
+    # only the triangles straddling an outline are clipped. The remaining mesh is split into connected components once;
+    # a component touching a zone outline but not its borderline is that transformation's residual, all others stay
+    # fixed. Zones overlapping each other go to the transformation listed first.
+    ret = Partition()
+    trIds = [trId for trId, tr in enumerate(transformations) if tr.parentTransformation is None and not tr.isResidual]
+    if not trIds:
+        ret.fixed = mesh
+        return ret
+    regions = [transformations[trId].boundaries for trId in trIds]
+    with span("partition_mesh", zones=len(trIds)) as sp:
+        sp.set_mesh(mesh)
+        zones, rest = cut_regions(mesh, regions, [transformations[trId].getOutlinePts() for trId in trIds])
+        for region, trId in enumerate(trIds):
+            ret.zones[trId] = zones[region]
+            ret.residuals[trId] = []
+        if rest is None:
+            return ret
+
+        points, faces, pointRegions, cellRegions, count = label_components(rest)
+        owner = np.full(count, -1, dtype=np.int64)
+        for region, trId in enumerate(trIds):
+            if ret.zones[trId] is None:
+                continue
+            tr = transformations[trId]
+            seam = np.unique(pointRegions[near_boundary(regions[region], points)])
+            border = np.unique(pointRegions[near_boundary(shapely.LineString([p[:2] for p in tr.getBorderlinePts()]),
+                                                          points)])
+            residual = np.setdiff1d(seam, border)
+            owner[residual[owner[residual] < 0]] = region
+
+        groups = owner[cellRegions]
+        ret.fixed = submesh(points, faces[groups < 0])
+        for region, trId in enumerate(trIds):
+            mesh_residual = submesh(points, faces[groups == region])
+            ret.residuals[trId] = [mesh_residual] if mesh_residual is not None else []
+    return ret
+
+
+class LayerPartition:
+    # 2D partition of the base layer, applied to the layers stacked on it: the zones of all cutting transformations
+    # (nested ones included), the footprints of the base layer residuals and the fixed region as everything else.
+    # Stacked layers are cut at the zone outlines only; all other pieces are assigned by looking up their triangles.
+    def __init__(self, zoneIds, zones, outlines, residualIds, footprints):
+        self.zoneIds = zoneIds
+        self.zones = zones
+        self.outlines = outlines
+        self.residualIds = residualIds
+        self.footprints = footprints
+        self.trees = None
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["trees"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+    @staticmethod
+    def from_transformations(transformations, layerId=0):
+        from MatrixTransformer import get_footprint
+
+        zoneIds, zones, outlines, residualIds, footprints = [], [], [], [], []
+        for trId, tr in enumerate(transformations):
+            if layerId not in tr.layerIds:
+                continue
+            if tr.isResidual:
+                footprint = get_footprint(tr.meshes[tr.layerIds.index(layerId)])
+                if footprint is not None:
+                    residualIds.append(trId)
+                    footprints.append(footprint)
+            else:
+                zoneIds.append(trId)
+                zones.append(tr.boundaries)
+                outlines.append(np.asarray(tr.getOutlinePts(), dtype=float))
+        return LayerPartition(zoneIds, zones, outlines, residualIds, footprints)
+
+    def get_trees(self):
+        if self.trees is None:
+            self.trees = (shapely.STRtree(self.zones), shapely.STRtree(self.footprints))
+        return self.trees
+
+    def apply(self, mesh):
+        # Same result as assign_layer: transformed and residual pieces by transformation index and the handle of the
+        # fixed mesh.
+        zoneTree, footprintTree = self.get_trees()
+        pieces = {}
+        residuals = {}
+        with span("apply_partition", zones=len(self.zones), residuals=len(self.footprints)) as sp:
+            sp.set_mesh(mesh)
+            if self.zones:
+                zones, rest = cut_regions(mesh, self.zones, self.outlines, zoneTree)
+                pieces = {trId: zone for trId, zone in zip(self.zoneIds, zones) if zone is not None}
+            else:
+                rest = mesh
+            if rest is None or not self.footprints:
+                return pieces, residuals, MeshHandle(rest)
+
+            points, faces = mesh_to_arrays(rest)
+            centers = points[faces].mean(axis=1)
+            triIds, regionIds = footprintTree.query(shapely.points(centers[:, 0], centers[:, 1]),
+                                                    predicate="intersects")
+            groups = np.full(len(faces), len(self.footprints), dtype=np.int64)
+            np.minimum.at(groups, triIds, regionIds)
+            for region, trId in enumerate(self.residualIds):
+                mesh_residual = submesh(points, faces[groups == region])
+                if mesh_residual is not None:
+                    residuals[trId] = mesh_residual
+            return pieces, residuals, MeshHandle(submesh(points, faces[groups == len(self.footprints)]))
@@ -0,0 +1,120 @@
+import time
+from contextlib import contextmanager
+
+
+def format_eta(seconds):
+    if seconds is None:
+        return ""
+    seconds = int(round(seconds))
+    if seconds >= 3600:
+        return "{}h {:02d}m".format(seconds // 3600, (seconds % 3600) // 60)
+    if seconds >= 60:
+        return "{}m {:02d}s".format(seconds // 60, seconds % 60)
+    return "{}s".format(seconds)
+
+
+class ProgressReporter:
+    # Hierarchical progress (stage > layer > transformation > ...). Every level knows how many children it has,
+    # finished children advance their parent. Sinks are only called at most every `interval` seconds.
+
+    def __init__(self, sinks=None, interval=0.1):
+        self.sinks = list(sinks) if sinks else []
+        self.interval = interval
+        self.levels = []
+        self.started = None
+        self.last_report = 0
+
+    def add_sink(self, sink):
+        self.sinks.append(sink)
+
+    def begin(self, label, total=1):
+        if not self.levels:
+            self.started = time.monotonic()
+            self.last_report = 0
+        self.levels.append([label, 0, max(int(total), 1)])
+        self.report(force=len(self.levels) == 1)
+
+    def step(self, cur=None, label=None):
+        if not self.levels:
+            return
+        level = self.levels[-1]
+        level[1] = level[1] + 1 if cur is None else cur
+        if label is not None:
+            level[0] = label
+        self.report()
+
+    def end(self):
+        if not self.levels:
+            return
+        self.levels.pop()
+        if self.levels:
+            self.step()
+
+    @contextmanager
+    def task(self, label, total=1):
+        self.begin(label, total)
+        try:
+            yield self
+        finally:
+            self.end()
+
+    def fraction(self):
+        ret = 0.0
+        scale = 1.0
+        for label, cur, total in self.levels:
+            ret += scale * min(cur, total) / total
+            scale /= total
+        return min(ret, 1.0)
+
+    def eta(self, fraction):
+        if self.started is None or fraction < 0.01:
+            return None
+        elapsed = time.monotonic() - self.started
+        return elapsed * (1 - fraction) / fraction
+
+    def message(self):
+        return " > ".join(level[0] for level in self.levels)
+
+    def report(self, force=False):
+        now = time.monotonic()
+        if not force and now - self.last_report < self.interval:
+            return
+        self.last_report = now
+        fraction = self.fraction()
+        percent = int(fraction * 100)
+        message = self.message()
+        eta = self.eta(fraction)
+        for sink in self.sinks:
+            sink.update(percent, message, eta)
+
+    def notify(self, message, percent=None):
+        if percent is None:
+            percent = int(self.fraction() * 100)
+        self.last_report = time.monotonic()
+        for sink in self.sinks:
+            sink.update(percent, message, None)
+
+    def finish(self, message):
+        self.levels.clear()
+        self.started = None
+        self.notify(message, 100)
+
+
+class QtProgressSink:
+    def __init__(self, progress, status):
+        self.progress_signal = progress
+        self.status_signal = status
+
+    def update(self, percent, message, eta):
+        self.progress_signal.emit(percent)
+        if eta is not None:
+            message = "{} (ETA {})".format(message, format_eta(eta))
+        self.status_signal.emit(message)
+
+
+class CallbackProgressSink:
+    def __init__(self, callback):
+        self.callback = callback
+
+    def update(self, percent, message, eta):
+        self.callback(percent, message, eta)
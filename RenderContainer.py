@@ -1,3 +1,4 @@
+import concurrent.futures
 from enum import Enum
 import vedo as v
 from Transformation import *
@@ -5,10 +6,23 @@ import MeshLayer
 
 ItemType = Enum('ItemType', 'Layer Transformation Debug')
 
+# triangles a view shows while the camera moves; beyond that, decimated proxies stand in for the meshes
+LOD_BUDGET = 1000000
+# meshes below this size are always shown in full
+LOD_MIN_TRIANGLES = 10000
+
+
+def build_proxy(item, fraction):
+    # runs on the LOD thread and works on a copy, the shown mesh is never touched
+    proxy = item.clone(deep=True).decimate(fraction)
+    proxy.pickable(False)
+    return proxy
+
 
 class RenderContainer:
-    def __init__(self, plt=None):
-        if plt is None:
+    def __init__(self, plt=None, headless=False, budget=LOD_BUDGET):
+        # a headless container only collects the items; nothing is ever rendered
+        if plt is None and not headless:
             plt = v.Plotter(axes=1, interactive=True)
         self.plotter = plt
         self.layers = {}
@@ -17,6 +31,17 @@ class RenderContainer:
         self.transformations_visible = True
         self.debug = {}
         self.debug_visible = True
+        # actors currently added to the plotter and whether they are switched on, by (container, label)
+        self.actors = {}
+        self.shown = {}
+        self.initialized = False
+        # level of detail: finished and pending proxies with their decimation fraction, by (container, label); the
+        # items themselves stay at full resolution
+        self.budget = budget
+        self.proxies = {}
+        self.pending = {}
+        self.interacting = False
+        self.lodPool = None
 
     def add_layer(self, label, item, vis=True):
         self.layers[label] = [item, vis]
@@ -71,21 +96,143 @@ class RenderContainer:
         return struct
 
     def render(self):
-        renderList = []
-        self.plotter.clear()
+        if self.plotter is None:
+            return
+        if not self.initialized:
+            # the first show() sets up the window and interactor, afterwards the actors are only synchronized
+            self.plotter.show(self.sync(), resetcam=False)
+            self.initialized = True
+            self.add_lod_callbacks()
+        else:
+            self.sync()
+        print("+++ Rendering RC +++")
+        self.plotter.render()
+
+    def sync(self):
+        # Brings the plotter in line with the containers: new or replaced items are added, dropped ones removed and
+        # all others only switched on or off, so unchanged actors keep their uploaded data. Hidden items are not
+        # added before they are shown the first time. Returns the items that were added.
+        wanted = {}
         for name in ["layers", "transformations", "debug"]:
             container = getattr(self, name)
             container_visible = getattr(self, name + "_visible")
-            if not container_visible:
-                continue
-
             for label in container:
                 item, visible = container[label]
+                wanted[(name, label)] = (item, container_visible and visible)
 
-                if visible:
-                    renderList.append(item)
-        self.plotter.show(renderList, resetcam=False)
-        print("+++ Rendering RC +++")
+        for key in list(self.actors):
+            if key not in wanted or wanted[key][0] is not self.actors[key]:
+                actor = self.actors.pop(key)
+                del self.shown[key]
+                # the same item may still be shown under another label
+                if not any(actor is other for other in self.actors.values()):
+                    self.plotter.remove(actor)
+                self.drop_proxy(key)
+
+        added = []
+        for key, (item, visible) in wanted.items():
+            if key not in self.actors:
+                if not visible:
+                    continue
+                self.actors[key] = item
+                added.append(item)
+            self.shown[key] = visible
+        if added and self.initialized:
+            self.plotter.add(added)
+        self.collect_proxies()
+        self.request_proxies()
+        self.apply_detail()
+        return added
+
+    def apply_detail(self):
+        # Visibility is decided per actor, as one item may be shown under several labels: it is on if any of them
+        # shows it in full, otherwise the proxy of the first label showing it reduced stands in.
+        full = set()
+        low = {}
+        for key, item in self.actors.items():
+            if not self.shown[key]:
+                continue
+            proxy = self.proxies.get(key)
+            if proxy is not None and self.interacting:
+                low.setdefault(id(item), proxy[0])
+            else:
+                full.add(id(item))
+        for key, item in self.actors.items():
+            if id(item) in full:
+                item.on()
+            else:
+                item.off()
+            proxy = self.proxies.get(key)
+            if proxy is not None:
+                if id(item) not in full and low.get(id(item)) is proxy[0]:
+                    proxy[0].on()
+                else:
+                    proxy[0].off()
+
+    def request_proxies(self):
+        # decimates the shown meshes in the background once they exceed the budget together; a proxy is rebuilt only
+        # if it turned out at least twice as detailed as the budget allows now
+        if self.budget is None or self.plotter is None:
+            return
+        total = sum(item.ncells for key, item in self.actors.items() if self.shown[key] and hasattr(item, "ncells"))
+        if total <= self.budget:
+            return
+        fraction = self.budget / total
+        for key, item in self.actors.items():
+            if not self.shown[key] or getattr(item, "ncells", 0) < LOD_MIN_TRIANGLES:
+                continue
+            current = self.pending.get(key) or self.proxies.get(key)
+            if current is not None and current[1] <= 2 * fraction:
+                continue
+            if key in self.pending:
+                self.pending[key][0].cancel()
+            if self.lodPool is None:
+                self.lodPool = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+            self.pending[key] = (self.lodPool.submit(build_proxy, item, fraction), fraction)
+
+    def collect_proxies(self):
+        # takes over the finished proxies; actors are only touched here, on the GUI thread
+        if not self.initialized:
+            return
+        for key in list(self.pending):
+            future, fraction = self.pending[key]
+            if not future.done():
+                continue
+            del self.pending[key]
+            if future.cancelled():
+                continue
+            if future.exception() is not None:
+                print("Could not build display proxy for '{}': {}".format(key[1], future.exception()))
+                continue
+            if key in self.proxies:
+                self.plotter.remove(self.proxies[key][0])
+            proxy = future.result()
+            proxy.off()
+            self.proxies[key] = (proxy, fraction)
+            self.plotter.add(proxy)
+
+    def drop_proxy(self, key):
+        if key in self.pending:
+            self.pending.pop(key)[0].cancel()
+        if key in self.proxies:
+            self.plotter.remove(self.proxies.pop(key)[0])
+
+    def add_lod_callbacks(self):
+        if self.budget is None or getattr(self.plotter, "interactor", None) is None:
+            return
+        self.plotter.add_callback("StartInteraction", self.start_interaction)
+        self.plotter.add_callback("EndInteraction", self.end_interaction)
+
+    def start_interaction(self, event):
+        # proxies are only shown while the camera moves
+        self.interacting = True
+        self.collect_proxies()
+        self.apply_detail()
+
+    def end_interaction(self, event):
+        # the camera is still again, back to full detail
+        self.interacting = False
+        self.apply_detail()
         self.plotter.render()
 
     def clear(self):
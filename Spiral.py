@@ -49,6 +49,7 @@ class Spiral(DirBend):
                 raise ValueError("Transformation '{}' overdefined. Expecting exactly 2 of these values: Diameter, length, turns/angle".format(name))   #  TODO: Specify type
             self.diameter = data["diameter"]
             self.angle = data["angle"]
+            self.turns = data["turns"]
             self.length = np.pi * self.diameter * self.turns
             print("Calculated length as {}".format(self.length))
         elif ("diameter" in data) and ("length" in data):
@@ -140,22 +141,6 @@ class Spiral(DirBend):
         ret.name = self.name + "-Res"
         return ret
 
-
-    def transformMesh(self, mesh):
-        print("--> Transforming a whole mesh now")
-        mesh.rotate_z(self.z_angle, rad=True, around=self.pivot)
-        points = mesh.points()
-        for pid, pt in enumerate(points):
-            self.parent.update_progress(pid, len(points))
-            vec = np.array([pt[0], pt[1], pt[2], 1])
-            vec = np.dot(self.getMatrixAt(pt), vec)
-            points[pid][0] = vec[0]
-            points[pid][1] = vec[1]
-            points[pid][2] = vec[2]
-        mesh.points(points)
-        mesh.rotate_z(-self.z_angle, rad=True, around=self.pivot)
-        return mesh
-
     def getMatrixAt(self, pt):  #TODO
         x = pt[0]
         y = pt[1]
@@ -0,0 +1,81 @@
+import os
+import re
+import numpy as np
+
+# one triangle of a binary STL file, 50 bytes without padding
+STL_RECORD = np.dtype([("normal", "<f4", (3,)), ("vertices", "<f4", (3, 3)), ("attr", "<u2")])
+STL_HEADER = 80
+
+ASCII_VERTEX = re.compile(rb"vertex\s+(\S+)\s+(\S+)\s+(\S+)")
+
+
+def is_binary_stl(filename):
+    # ASCII files may start with anything, but only binary ones match their triangle count exactly; some exporters
+    # also begin binary headers with "solid"
+    size = os.path.getsize(filename)
+    if size < STL_HEADER + 4:
+        return False
+    with open(filename, "rb") as f:
+        f.seek(STL_HEADER)
+        count = int(np.frombuffer(f.read(4), dtype="<u4")[0])
+    return size == STL_HEADER + 4 + count * STL_RECORD.itemsize
+
+
+def map_stl(filename):
+    # triangle records of a binary STL file as a read-only memory map; nothing is read before it is accessed
+    return np.memmap(filename, dtype=STL_RECORD, mode="r", offset=STL_HEADER + 4)
+
+
+def read_ascii_stl(filename):
+    with open(filename, "rb") as f:
+        vertices = np.array(ASCII_VERTEX.findall(f.read()), dtype=np.float32)
+    if len(vertices) % 3 != 0:
+        raise ValueError("Malformed ASCII STL file '{}': {} vertices".format(filename, len(vertices)))
+    return vertices.reshape(-1, 3, 3)
+
+
+# multipliers hashing the bits of the x, y and z coordinates into one key
+WELD_HASH = (np.uint64(0x9E3779B97F4A7C15), np.uint64(0xC2B2AE3D27D4EB4F), np.uint64(0x165667B19E3779F9))
+NEGATIVE_ZERO = np.uint32(0x80000000)
+
+
+def weld_vertices(vertices):
+    # Merges bitwise equal corners of an (n, 3, 3) triangle array into points and per-corner point ids (0.0 and -0.0
+    # are taken as equal). The three coordinates are hashed into one 64 bit key, so the deduplication sorts integers
+    # instead of rows; should two different vertices share a key, the rows are compared instead. The keys are built
+    # one coordinate at a time and only the unique corners are gathered, so a memory-mapped array is never copied as
+    # a whole.
+    keys = np.zeros(vertices.shape[:2], dtype=np.uint64)
+    for axis, factor in enumerate(WELD_HASH):
+        bits = vertices[:, :, axis].view(np.uint32).astype(np.uint64)
+        bits[bits == NEGATIVE_ZERO] = 0
+        keys ^= bits * factor
+    _, first, inverse = np.unique(keys.reshape(-1), return_index=True, return_inverse=True)
+    del keys
+    ids = inverse.reshape(-1, 3)
+    points = vertices[first // 3, first % 3]
+    if not all(np.array_equal(points[ids[:, k]], vertices[:, k]) for k in range(3)):
+        corners = np.add(vertices, np.float32(0)).reshape(-1, 3)
+        _, first, inverse = np.unique(corners.view(np.dtype((np.void, 12))).ravel(), return_index=True,
+                                      return_inverse=True)
+        points = corners[first]
+    # adding zero turns -0.0 into 0.0
+    points += np.float32(0)
+    return points, inverse.reshape(-1)
+
+
+def read_stl(filename):
+    # Points and faces of a binary or ASCII STL file with shared vertices welded and collapsed triangles dropped.
+    if is_binary_stl(filename):
+        records = map_stl(filename)
+        vertices = records["vertices"]
+    else:
+        records = None
+        vertices = read_ascii_stl(filename)
+    if len(vertices) == 0:
+        raise ValueError("STL file '{}' contains no triangles".format(filename))
+    points, ids = weld_vertices(vertices)
+    del vertices, records
+    faces = ids.reshape(-1, 3)
+    valid = (faces[:, 0] != faces[:, 1]) & (faces[:, 1] != faces[:, 2]) & (faces[:, 0] != faces[:, 2])
+    return points.astype(float), faces[valid].astype(np.int64)
@@ -0,0 +1,198 @@
+import copy
+import json
+import os
+import numpy as np
+
+# board layout in mm: a spine along x with one tab per bend zone sticking out in +y
+SPINE_WIDTH = 30
+TAB_WIDTH = 20
+TAB_GAP = 20
+TAB_LENGTH = 70
+ZONE_OFFSET = 10
+ZONE_MARGIN = 4
+ZONE_LENGTH = 20
+# slant of the DirBend and Spiral baselines; a 3-4-5 triangle keeps all zone corners exact
+SLANT_RISE, SLANT_RUN, SLANT_HYPOT = 3, 4, 5
+SLANT = np.arctan2(SLANT_RISE, SLANT_RUN)
+TRACE_WIDTH = 2
+
+
+def grid_triangles(mask, x0, y0, h, z0, z1):
+    # Closed slab over the active cells of `mask` (rows along y, columns along x) between z0 and z1, as an (n, 3, 3)
+    # array of triangles with outward normals.
+    j, i = np.nonzero(mask)
+    # neighbouring cells share their corners bit for bit, so the vertices weld into one connected slab
+    xa = (x0 + i * h).astype(np.float32)
+    ya = (y0 + j * h).astype(np.float32)
+    xb = (x0 + (i + 1) * h).astype(np.float32)
+    yb = (y0 + (j + 1) * h).astype(np.float32)
+    parts = [
+        triangles_2d((xa, ya), (xb, ya), (xb, yb), z1),
+        triangles_2d((xa, ya), (xb, yb), (xa, yb), z1),
+        triangles_2d((xa, ya), (xb, yb), (xb, ya), z0),
+        triangles_2d((xa, ya), (xa, yb), (xb, yb), z0),
+    ]
+    # side walls on every cell edge facing an inactive cell; the edges run with the interior on their left
+    padded = np.pad(mask, 1)
+    sides = [
+        (~padded[j + 1, i], (xa, yb), (xa, ya)),
+        (~padded[j + 1, i + 2], (xb, ya), (xb, yb)),
+        (~padded[j, i + 1], (xa, ya), (xb, ya)),
+        (~padded[j + 2, i + 1], (xb, yb), (xa, yb)),
+    ]
+    for edge, p, q in sides:
+        p = (p[0][edge], p[1][edge])
+        q = (q[0][edge], q[1][edge])
+        parts.append(wall_triangles(p, q, z0, z1))
+    return np.concatenate(parts)
+
+
+def triangles_2d(a, b, c, z):
+    n = len(a[0])
+    ret = np.empty((n, 3, 3), dtype=np.float32)
+    for k, (x, y) in enumerate((a, b, c)):
+        ret[:, k, 0] = x
+        ret[:, k, 1] = y
+        ret[:, k, 2] = z
+    return ret
+
+
+def wall_triangles(p, q, z0, z1):
+    n = len(p[0])
+    ret = np.empty((2 * n, 3, 3), dtype=np.float32)
+    corners = [((p, z0), (q, z0), (q, z1)), ((p, z0), (q, z1), (p, z1))]
+    for t, triangle in enumerate(corners):
+        for k, ((x, y), z) in enumerate(triangle):
+            ret[t * n:(t + 1) * n, k, 0] = x
+            ret[t * n:(t + 1) * n, k, 1] = y
+            ret[t * n:(t + 1) * n, k, 2] = z
+    return ret
+
+
+def write_stl(filename, triangles):
+    normals = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+    length = np.linalg.norm(normals, axis=1, keepdims=True)
+    normals = normals / np.where(length > 0, length, 1)
+    records = np.zeros(len(triangles), dtype=[("normal", "<f4", (3,)), ("vertices", "<f4", (3, 3)),
+                                              ("attr", "<u2")])
+    records["normal"] = normals
+    records["vertices"] = triangles
+    with open(filename, "wb") as f:
+        f.write(b"FTL synthetic board".ljust(80, b" "))
+        np.array([len(records)], dtype="<u4").tofile(f)
+        records.tofile(f)
+
+
+def board_layout(zones):
+    length = max(zones * (TAB_WIDTH + TAB_GAP) + TAB_GAP, 100)
+    tabs = [(TAB_GAP + k * (TAB_WIDTH + TAB_GAP), TAB_GAP + k * (TAB_WIDTH + TAB_GAP) + TAB_WIDTH)
+            for k in range(zones)]
+    return length, SPINE_WIDTH + TAB_LENGTH, tabs
+
+
+def board_mask(h, length, width, tabs):
+    nx = int(np.ceil(length / h))
+    ny = int(np.ceil(width / h))
+    xc = (np.arange(nx) + 0.5) * h
+    yc = (np.arange(ny) + 0.5) * h
+    in_tab = np.zeros(nx, dtype=bool)
+    for x0, x1 in tabs:
+        in_tab |= (xc >= x0) & (xc < x1)
+    return (yc[:, None] < SPINE_WIDTH) | (in_tab[None, :] & (yc[:, None] < width))
+
+
+def trace_mask(h, length, width, tabs):
+    # one trace along the spine and one along every tab, each a separate copper island
+    nx = int(np.ceil(length / h))
+    ny = int(np.ceil(width / h))
+    xc = (np.arange(nx) + 0.5) * h
+    yc = (np.arange(ny) + 0.5) * h
+    half = TRACE_WIDTH / 2
+    mask = (np.abs(yc[:, None] - SPINE_WIDTH / 4) < half) & (xc[None, :] > 5) & (xc[None, :] < length - 5)
+    for x0, x1 in tabs:
+        mid = (x0 + x1) / 2
+        mask |= (np.abs(xc[None, :] - mid) < half) & (yc[:, None] > SPINE_WIDTH / 2) & (yc[:, None] < width - 5)
+    return mask
+
+
+def slanted_points(x0, x1, y0, length):
+    # zone across a tab starting at a baseline falling from left to right (as DirBend expects), bending towards the
+    # upper right
+    dy = (x1 - x0 + 2 * ZONE_MARGIN) * SLANT_RISE / SLANT_RUN
+    p0 = np.array((x0 - ZONE_MARGIN, y0 + dy))
+    p1 = np.array((x1 + ZONE_MARGIN, y0))
+    normal = np.array((length * SLANT_RISE / SLANT_HYPOT, length * SLANT_RUN / SLANT_HYPOT))
+    return [p0, p1, p1 + normal, p0 + normal]
+
+
+def zone_transformations(tabs, zbends, dirbends, spirals):
+    kinds = ["ZBend"] * zbends + ["DirBend"] * dirbends + ["Spiral"] * spirals
+    ret = []
+    for k, (kind, (x0, x1)) in enumerate(zip(kinds, tabs)):
+        y0 = SPINE_WIDTH + ZONE_OFFSET
+        name = "{}_{}".format(kind, k)
+        if kind == "ZBend":
+            ret.append({"name": name, "priority": 0, "type": "ZBend", "dir": "POSY", "angle": 90,
+                        "xmin": x0 - ZONE_MARGIN, "xmax": x1 + ZONE_MARGIN, "ymin": y0, "ymax": y0 + ZONE_LENGTH})
+        elif kind == "DirBend":
+            points = slanted_points(x0, x1, y0, ZONE_LENGTH)
+            ret.append({"name": name, "priority": 0, "type": "DirBend", "angle": 90,
+                        "points": [{"x": float(p[0]), "y": float(p[1])} for p in points]})
+        else:
+            points = slanted_points(x0, x1, y0, ZONE_LENGTH)[:2]
+            ret.append({"name": name, "priority": 0, "type": "Spiral", "dir": float(np.pi / 2 - SLANT),
+                        "length": ZONE_LENGTH, "turns": 1,
+                        "points": [{"x": float(p[0]), "y": float(p[1])} for p in points]})
+    check_zones(ret)
+    return ret
+
+
+def check_zones(transformations):
+    # the slanted zones have to bend over their full length, a degenerate one would only collapse onto its pivot
+    from DirBend import DirBend
+    from Spiral import Spiral
+
+    kinds = {"DirBend": DirBend, "Spiral": Spiral}
+    for tr in transformations:
+        if tr["type"] not in kinds:
+            continue
+        length = kinds[tr["type"]](copy.deepcopy(tr), name=tr["name"]).length
+        if not np.isclose(length, ZONE_LENGTH):
+            raise ValueError("Zone '{}' is {} mm long instead of {} mm".format(tr["name"], length, ZONE_LENGTH))
+
+
+def generate_board(directory, triangles=100000, zbends=1, dirbends=1, spirals=1, thickness=1.6, copper=0.035,
+                   name=None):
+    # Writes a flat board with traces of roughly `triangles` board triangles and one bend zone per tab, plus the FTL
+    # project using them. Returns the path of the project file.
+    zones = zbends + dirbends + spirals
+    if name is None:
+        name = "synthetic_{}_{}z{}d{}s".format(triangles, zbends, dirbends, spirals)
+    os.makedirs(directory, exist_ok=True)
+    length, width, tabs = board_layout(zones)
+    area = length * SPINE_WIDTH + zones * TAB_WIDTH * TAB_LENGTH
+    # top and bottom contribute four triangles per cell, the walls are negligible
+    h = float(np.sqrt(4 * area / triangles))
+    board = grid_triangles(board_mask(h, length, width, tabs), 0, 0, h, 0, thickness)
+    h_trace = min(h, TRACE_WIDTH / 2)
+    traces = grid_triangles(trace_mask(h_trace, length, width, tabs), 0, 0, h_trace, thickness,
+                            thickness + copper)
+
+    files = {"board": name + "_board.stl", "trace": name + "_trace.stl"}
+    write_stl(os.path.join(directory, files["board"]), board)
+    write_stl(os.path.join(directory, files["trace"]), traces)
+    project = {
+        "version": 0.1,
+        "mel": 4,
+        "mel_trans": 2,
+        "mel_residual": 4,
+        "layers": [
+            {"name": "PCB", "file": files["board"], "mel": 3, "mel_trans": 1, "mel_residual": 3},
+            {"name": "Copper", "file": files["trace"], "mel": 3, "mel_trans": 1, "mel_residual": 3},
+        ],
+        "transformations": zone_transformations(tabs, zbends, dirbends, spirals),
+    }
+    filename = os.path.join(directory, name + ".json")
+    with open(filename, "w") as f:
+        json.dump(project, f, indent=4)
+    return filename
@@ -0,0 +1,145 @@
+import atexit
+import functools
+import json
+import os
+import threading
+import time
+
+# Timed, nested spans exported in the Chrome trace event format (chrome://tracing, ui.perfetto.dev). While no tracer
+# is active, span() hands out a shared no-op span, so instrumented code only pays for one global lookup.
+
+_tracer = None
+# the last stopped tracer, its events can still be exported
+_stopped = None
+# open spans per thread, innermost last
+_open = threading.local()
+
+
+class Tracer:
+    def __init__(self):
+        self.events = []
+        self.lock = threading.Lock()
+
+    def add(self, name, start, end, args):
+        event = {"name": name, "ph": "X", "ts": start / 1000, "dur": (end - start) / 1000, "pid": os.getpid(),
+                 "tid": threading.get_ident(), "args": args}
+        with self.lock:
+            self.events.append(event)
+
+    def export(self, filename):
+        with self.lock:
+            events = list(self.events)
+        with open(filename, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        return len(events)
+
+
+class Span:
+    __slots__ = ("tracer", "name", "args", "start")
+
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+        self.start = None
+
+    def __enter__(self):
+        if not hasattr(_open, "spans"):
+            _open.spans = []
+        _open.spans.append(self)
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _open.spans.pop()
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        self.tracer.add(self.name, self.start, time.perf_counter_ns(), self.args)
+        return False
+
+    def set(self, **args):
+        self.args.update(args)
+
+    def set_mesh(self, mesh, prefix=""):
+        if mesh is None:
+            return
+        self.args[prefix + "vertices"] = mesh.npoints
+        self.args[prefix + "triangles"] = mesh.ncells
+
+
+class NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **args):
+        pass
+
+    def set_mesh(self, mesh, prefix=""):
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+def span(name, **args):
+    if _tracer is None:
+        return NULL_SPAN
+    return Span(_tracer, name, args)
+
+
+def current_span():
+    # innermost open span of this thread, e.g. the one of a @traced function, or the no-op span
+    spans = getattr(_open, "spans", None)
+    if _tracer is None or not spans:
+        return NULL_SPAN
+    return spans[-1]
+
+
+def traced(name):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _tracer is None:
+                return func(*args, **kwargs)
+            with Span(_tracer, name, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def tracing_enabled():
+    return _tracer is not None
+
+
+def start_tracing():
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer()
+    return _tracer
+
+
+def stop_tracing(filename=None):
+    # returns the number of exported events
+    global _tracer, _stopped
+    if _tracer is not None:
+        _stopped, _tracer = _tracer, None
+    if filename is None:
+        return 0
+    return export_trace(filename)
+
+
+def export_trace(filename):
+    tracer = _tracer if _tracer is not None else _stopped
+    if tracer is None:
+        return 0
+    return tracer.export(filename)
+
+
+if os.environ.get("FTL_TRACE"):
+    start_tracing()
+    atexit.register(export_trace, os.environ["FTL_TRACE"])
@@ -1,6 +1,50 @@
+import numpy as np
 import vedo as v
 import shapely
 from shapely.geometry import Point, Polygon, LineString, GeometryCollection
+from Tracing import span
+
+
+# points per kernel call of transformChainPoints when the transformation can be cancelled
+KERNEL_BLOCK = 1 << 18
+
+
+def mesh_to_arrays(mesh):
+    return np.asarray(mesh.points(), dtype=float), np.asarray(mesh.faces(), dtype=np.int64)
+
+
+def mesh_from_arrays(points, faces):
+    return v.Mesh([points, faces])
+
+
+def apply_affine(mat, points):
+    points = np.asarray(points, dtype=float)
+    return points @ mat[:, :3].T + mat[:, 3]
+
+
+def compose_affine(outer, inner):
+    # 3x4 affine that applies `inner` first, then `outer`
+    ret = np.zeros((3, 4), dtype=float)
+    ret[:, :3] = outer[:, :3] @ inner[:, :3]
+    ret[:, 3] = outer[:, :3] @ inner[:, 3] + outer[:, 3]
+    return ret
+
+
+def chord_length(radius, tolerance):
+    # longest arc (on radius) whose chord deviates at most `tolerance` from it; None if any length will do
+    if tolerance >= radius:
+        return None
+    return 2 * radius * np.arccos(1 - tolerance / radius)
+
+
+def rotation_z_affine(angle, pivot):
+    c = np.cos(angle)
+    s = np.sin(angle)
+    ret = np.zeros((3, 4), dtype=float)
+    ret[0] = c, -s, 0, pivot[0] - c * pivot[0] + s * pivot[1]
+    ret[1] = s, c, 0, pivot[1] - s * pivot[0] - c * pivot[1]
+    ret[2] = 0, 0, 1, 0
+    return ret
 
 
 class Transformation:
@@ -20,10 +64,38 @@ class Transformation:
         self.parent = None
         self.name = name
         self.transformWholeMesh = False
+        self.layerIds = []
+        # stage products: subdivided point/face arrays per mesh and the transformed result meshes
+        self.preprocessed = {}
+        self.results = []
+        self.residual = None
+        # nesting: this transformation lies inside the residual region of parentTransformation
+        self.parentTransformation = None
+        self.children = []
+        self.fixed_footprint = None
+        # chordal tolerance of the adaptive refinement; None refines uniformly with the MEL
+        self.tolerance = None
+        # cancellation token of the owning transformer, checked between kernel blocks
+        self.token = None
 
     def __str__(self):
         print("Transformation")
 
+    def __getstate__(self):
+        # worker processes only get the geometry; meshes and the owning transformer stay in the main process
+        state = self.__dict__.copy()
+        state["parent"] = None
+        state["meshes"] = []
+        state["scope"] = None
+        state["children"] = []
+        state["preprocessed"] = {}
+        state["results"] = []
+        state["token"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
     def getOutline(self):
         x = self.boundaries.exterior.coords.xy[0][:-1]
         y = self.boundaries.exterior.coords.xy[1][:-1]
@@ -34,7 +106,52 @@ class Transformation:
 
     def get_preprocessed_mesh(self, layerId):
         print("    Transformation {}\n     -> layer {}/{}".format(self, layerId, len(self.mel)))
-        return self.meshes[layerId].clone().subdivide(1, 2, self.mel[layerId])
+        with span("get_preprocessed_mesh", transformation=self.name) as sp:
+            sp.set_mesh(self.meshes[layerId], "input_")
+            ret = self.preprocess_mesh(self.meshes[layerId], self.mel[layerId])
+            sp.set_mesh(ret)
+        return ret
+
+    def preprocess_mesh(self, mesh, mel):
+        if self.tolerance is not None:
+            return self.refine_mesh(mesh, self.tolerance)
+        return mesh.clone().subdivide(1, 2, mel)
+
+    def refine_mesh(self, mesh, tolerance):
+        # Splits only edges running across the bend, until the chords of the outermost surface stay within
+        # `tolerance`. The mesh is scaled so that this edge length becomes 1 along the bend direction while the other
+        # directions shrink below 1, subdivided adaptively and scaled back. Rigid transformations are not refined.
+        radius = self.getBendRadius()
+        direction = self.getBendDirection()
+        # preprocessed meshes are only read, so unrefined ones are not copied
+        if radius is None or direction is None or mesh.npoints == 0:
+            return mesh
+        points, faces = mesh_to_arrays(mesh)
+        outer = radius + np.abs(points[:, 2]).max()
+        length = chord_length(outer, tolerance)
+        if length is None:
+            return mesh
+        # the same bend angle spans a shorter distance on the undeformed mesh
+        length *= radius / outer
+        size = max(np.ptp(points, axis=0).max(), length) * 2
+        d = np.asarray(direction, dtype=float) / np.linalg.norm(direction)
+        scale = np.array([[d[0] / length, d[1] / length, 0],
+                          [-d[1] / size, d[0] / size, 0],
+                          [0, 0, 1 / size]])
+        scaled = mesh_from_arrays(points @ scale.T, faces).subdivide(1, 2, mel=1)
+        refined, faces = mesh_to_arrays(scaled)
+        return mesh_from_arrays(refined @ np.linalg.inv(scale).T, faces)
+
+    def getBendRadius(self):
+        return None
+
+    def getBendDirection(self):
+        return None
+
+    def get_preprocessed_arrays(self, meshNum):
+        if meshNum not in self.preprocessed:
+            self.preprocessed[meshNum] = mesh_to_arrays(self.get_preprocessed_mesh(meshNum))
+        return self.preprocessed[meshNum]
 
     def getArea(self):
         return self.getOutline().triangulate().lw(0)
@@ -45,6 +162,44 @@ class Transformation:
     def getMatrixAt(self, pt):
         raise NotImplementedError("Please implement the function in a new class.")
 
+    def transformPoints(self, points):
+        # generic fallback; subclasses override this with a vectorized kernel
+        points = np.asarray(points, dtype=float)
+        ret = np.empty_like(points)
+        for pid, pt in enumerate(points):
+            ret[pid] = np.dot(self.getMatrixAt(pt), (pt[0], pt[1], pt[2], 1))
+        return ret
+
+    def getChainMatrix(self):
+        # residual affines of all ancestors composed into one matrix, applied after this transformation
+        mat = np.eye(3, 4)
+        tr = self.parentTransformation
+        while tr is not None:
+            mat = compose_affine(tr.residual.getAffine(), mat)
+            tr = tr.parentTransformation
+        return mat
+
+    def transformChainPoints(self, points):
+        # large arrays go through the kernel in blocks, so a cancelled job stops after the current block
+        points = np.asarray(points, dtype=float)
+        if self.token is None or len(points) <= KERNEL_BLOCK:
+            return self.transformChainBlock(points)
+        ret = np.empty_like(points)
+        for start in range(0, len(points), KERNEL_BLOCK):
+            self.token.check()
+            ret[start:start + KERNEL_BLOCK] = self.transformChainBlock(points[start:start + KERNEL_BLOCK])
+        return ret
+
+    def transformChainBlock(self, points):
+        points = self.transformPoints(points)
+        if self.parentTransformation is None:
+            return points
+        return apply_affine(self.getChainMatrix(), points)
+
+    def transformMesh(self, mesh):
+        mesh.points(self.transformChainPoints(mesh.points()))
+        return mesh
+
     def isInScope(self, point):
         raise NotImplementedError("Please implement the function in a new class.")
 
@@ -0,0 +1,170 @@
+import collections
+import concurrent.futures
+import zlib
+import numpy as np
+
+from Tracing import span
+
+try:
+    import VMeshTools as vmt
+except ImportError:
+    vmt = None
+
+VMAP_GEOMETRY = "/VMAP/GEOMETRY"
+# rows per HDF5 chunk; 64k points are 1.5 MB uncompressed
+CHUNK_ROWS = 1 << 16
+
+
+def get_vmap_pieces(transformer):
+    # (name, mesh, attributes) of every bent piece, named after layer and transformation
+    ret = []
+    for layerId, name, mesh in transformer.get_result_pieces():
+        if mesh is None or mesh.ncells == 0:
+            continue
+        layer = transformer.layers[layerId]
+        ret.append(("{}_{}".format(layer.name, name), mesh, {"MYLAYER": layerId, "MYTRANSFORMATION": name}))
+    return ret
+
+
+def get_piece_arrays(mesh):
+    return np.asarray(mesh.points(), dtype=np.float64), np.asarray(mesh.faces(), dtype=np.int64)
+
+
+class H5VmapWriter:
+    # Writes geometry groups (POINTS and ELEMENTS with coordinates, connectivity and identifiers) into an HDF5 file,
+    # every dataset chunked and gzip compressed. The chunks are shuffled and compressed by prepare(), which may run on
+    # several threads, and stored as they are by write_geometry(). h5py is only needed once a writer is created.
+    # On its own this is a geometry-only subset of VMAP for installations without VMeshTools: there is no /VMAP/SYSTEM
+    # group, no element type table and MYCONNECTIVITY is a plain (n, 3) triangle block.
+    def __init__(self, filename, level=4, chunk_rows=CHUNK_ROWS, mode="w"):
+        import h5py
+        self.filename = filename
+        self.file = h5py.File(filename, mode)
+        self.level = level
+        self.chunk_rows = chunk_rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def compress(self, data):
+        # the chunks of `data` as HDF5 stores them with the shuffle and deflate filters, the last one padded to full size
+        rows = min(len(data), self.chunk_rows)
+        chunks = []
+        for start in range(0, len(data), rows):
+            block = np.zeros((rows,) + data.shape[1:], dtype=data.dtype)
+            block[:min(rows, len(data) - start)] = data[start:start + rows]
+            shuffled = block.view(np.uint8).reshape(-1, data.dtype.itemsize).T
+            chunks.append(zlib.compress(shuffled.tobytes(), self.level))
+        return chunks
+
+    def prepare(self, mesh):
+        points, faces = get_piece_arrays(mesh)
+        datasets = {"POINTS/MYCOORDINATES": points,
+                    "POINTS/MYIDENTIFIERS": np.arange(len(points), dtype=np.int64),
+                    "ELEMENTS/MYCONNECTIVITY": faces,
+                    "ELEMENTS/MYIDENTIFIERS": np.arange(len(faces), dtype=np.int64)}
+        return {key: (data.shape, data.dtype, self.compress(data)) for key, data in datasets.items()}
+
+    def write_geometry(self, path, name, datasets, attrs=None):
+        group = self.file.require_group(path)
+        group.attrs["MYNAME"] = name
+        for key, value in (attrs or {}).items():
+            group.attrs[key] = value
+        for key, (shape, dtype, chunks) in datasets.items():
+            if not chunks:
+                group.create_dataset(key, shape=shape, dtype=dtype)
+                continue
+            rows = min(shape[0], self.chunk_rows)
+            dataset = group.create_dataset(key, shape=shape, dtype=dtype, chunks=(rows,) + shape[1:],
+                                           compression="gzip", compression_opts=self.level, shuffle=True)
+            for k, chunk in enumerate(chunks):
+                dataset.id.write_direct_chunk((k * rows,) + (0,) * (len(shape) - 1), chunk)
+
+    def read_geometry(self, path):
+        group = self.file[path]
+        name = group.attrs["MYNAME"]
+        return name, group["POINTS/MYCOORDINATES"][()], group["ELEMENTS/MYCONNECTIVITY"][()]
+
+    def close(self):
+        self.file.close()
+
+
+class VmtVmapWriter(H5VmapWriter):
+    # Lets VMeshTools create the file with the system metadata of the standard and adds the geometry groups through
+    # H5VmapWriter, so they are chunked and compressed as well. The piece attributes are kept on the groups.
+    def __init__(self, filename, level=4, chunk_rows=CHUNK_ROWS):
+        vmt.VMAPFileHandler(filename)
+        super().__init__(filename, level, chunk_rows, mode="a")
+
+
+class MemoryVmapWriter:
+    # Stand-in for H5VmapWriter that keeps the written groups in a dict; for round trips without h5py.
+    def __init__(self):
+        self.groups = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def prepare(self, mesh):
+        return get_piece_arrays(mesh)
+
+    def write_geometry(self, path, name, arrays, attrs=None):
+        points, faces = arrays
+        self.groups[path] = {"name": name, "points": np.array(points), "faces": np.array(faces),
+                             "attrs": dict(attrs or {})}
+
+    def read_geometry(self, path):
+        group = self.groups[path]
+        return group["name"], group["points"], group["faces"]
+
+    def close(self):
+        pass
+
+
+def write_vmap(writer, pieces, workers=4):
+    # Prepares the pieces on a thread pool (array conversion and chunk compression, zlib releases the GIL) while the
+    # writer stores the finished ones in order. At most two pieces per thread are prepared ahead, so memory stays
+    # bounded for large assemblies. Only the writes are serial, HDF5 serializes them anyway. Returns the written group
+    # paths.
+    paths = []
+    with span("write_vmap", pieces=len(pieces)) as sp, \
+            concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = collections.deque()
+        queue = iter(enumerate(pieces))
+        for i, (name, mesh, attrs) in queue:
+            pending.append((i, name, attrs, pool.submit(writer.prepare, mesh)))
+            if len(pending) >= 2 * workers:
+                break
+        while pending:
+            i, name, attrs, future = pending.popleft()
+            path = "{}/{}".format(VMAP_GEOMETRY, i + 1)
+            writer.write_geometry(path, name, future.result(), attrs)
+            paths.append(path)
+            for i, (name, mesh, attrs) in queue:
+                pending.append((i, name, attrs, pool.submit(writer.prepare, mesh)))
+                break
+        sp.set(groups=len(paths))
+    return paths
+
+
+def get_vmap_writer(filename):
+    # a file laid out by VMeshTools if installed, the geometry-only subset otherwise
+    if vmt is not None:
+        return VmtVmapWriter(filename)
+    return H5VmapWriter(filename)
+
+
+def export_vmap(filename, pieces, workers=4, writer=None):
+    # writes the pieces into a new VMAP file, or into `writer` if given (which is left open)
+    if writer is not None:
+        return write_vmap(writer, pieces, workers)
+    with get_vmap_writer(filename) as writer:
+        return write_vmap(writer, pieces, workers)
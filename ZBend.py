@@ -129,7 +129,7 @@ class ZBend(Transformation):
             newTr[2] = 0, sin(a), cos(a), -self.ymax * sin(a) + r * (1 - cos(a))
 
             newBounds = shapely.geometry.box(self.parent.xmin, self.ymax, self.parent.xmax, self.parent.ymax)
-            return LinearTransformation(newTr, newBounds, self.prio, residual=True)
+            ret = LinearTransformation(newTr, newBounds, self.prio, residual=True)
 
         elif self.dir == DIR.NEGX:
             r = (self.xmax - self.xmin) / self.angle
@@ -158,6 +158,18 @@ class ZBend(Transformation):
         ret.name = self.name + "-Res"
         return ret
 
+    def getBendRadius(self):
+        if self.angle == 0:
+            return None
+        if self.dir in (DIR.NEGY, DIR.POSY):
+            return abs(self.ymax - self.ymin) / abs(self.angle)
+        return abs(self.xmax - self.xmin) / abs(self.angle)
+
+    def getBendDirection(self):
+        if self.dir in (DIR.NEGY, DIR.POSY):
+            return 0, 1
+        return 1, 0
+
     def getMatrixAt(self, pt):
         x = pt[0]
         y = pt[1]
@@ -195,3 +207,37 @@ class ZBend(Transformation):
             mat[1] = 0, 1, 0, 0
             mat[2] = 0, 0, cos(a), (1 - cos(a)) * r
         return mat
+
+    def transformPoints(self, points):
+        points = np.asarray(points, dtype=float)
+        x = points[:, 0]
+        y = points[:, 1]
+        z = points[:, 2]
+        ret = np.empty_like(points)
+        if self.dir == DIR.NEGY or self.dir == DIR.POSY:
+            r = (self.ymax - self.ymin) / self.angle
+            a = (y - self.ymin) / (self.ymax - self.ymin) * self.angle
+            sin_a = sin(a)
+            cos_a = cos(a)
+            ret[:, 0] = x
+            if self.dir == DIR.NEGY:
+                ret[:, 1] = z * sin_a + self.ymin + r * sin_a
+                ret[:, 2] = z * cos_a - (1 - cos_a) * r
+            else:
+                ret[:, 1] = -z * sin_a + self.ymin + r * sin_a
+                ret[:, 2] = z * cos_a + (1 - cos_a) * r
+        elif self.dir == DIR.NEGX or self.dir == DIR.POSX:
+            if self.dir == DIR.NEGX:
+                r = (self.xmax - self.xmin) / self.angle
+                a = (x - self.xmin) / (self.xmax - self.xmin) * self.angle
+            else:
+                r = abs(self.xmax - self.xmin) / self.angle
+                a = np.abs(x - self.xmin) / abs(self.xmax - self.xmin) * self.angle
+            sin_a = sin(a)
+            cos_a = cos(a)
+            ret[:, 0] = -z * sin_a + self.xmin + r * sin_a
+            ret[:, 1] = y
+            ret[:, 2] = z * cos_a + (1 - cos_a) * r
+        else:
+            raise ValueError("Direction of ZBend-Transformation not found: {}".format(self.dir))
+        return ret
@@ -0,0 +1,149 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+
+import numpy as np
+import vedo as v
+
+from FileParser import FileParser
+from RenderContainer import RenderContainer
+from SyntheticBoard import generate_board
+from ftl_batch import working_directory
+
+STAGES = ("load", "parse", "assign", "subdivide", "transform", "merge")
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_stages(filename, workers=None, cache=False):
+    # One pass through the pipeline with every stage timed on its own. The load stage only reads the STL files,
+    # parse includes the load time subdivision and subdivide pre-fills the refinement of the transformed pieces.
+    times = {}
+    counts = {}
+
+    @contextlib.contextmanager
+    def stage(name):
+        started = time.perf_counter()
+        yield
+        times[name] = time.perf_counter() - started
+
+    parser = FileParser(filename, RenderContainer(headless=True), RenderContainer(headless=True))
+    if not cache:
+        parser.meshCache = None
+    if workers is not None:
+        parser.workers = workers
+    with stage("load"):
+        meshes = [v.load(layer["file"]) for layer in parser.j_layers]
+    counts["input_points"] = sum(mesh.npoints for mesh in meshes)
+    counts["input_triangles"] = sum(mesh.ncells for mesh in meshes)
+    with stage("parse"):
+        parser.parse()
+    counts["loaded_points"] = sum(layer.mesh.npoints for layer in parser.layers)
+    transformer = parser.transformer
+    with stage("assign"):
+        transformer.calculate_assignments()
+    with stage("subdivide"):
+        for tr in transformer.transformations:
+            for meshNum in range(len(tr.meshes)):
+                tr.get_preprocessed_arrays(meshNum)
+    counts["subdivided_points"] = sum(len(points) for tr in transformer.transformations
+                                      for points, faces in tr.preprocessed.values())
+    with stage("transform"):
+        transformer.start_transformation()
+    with stage("merge"):
+        result = transformer.get_result_mesh()
+    counts["result_points"] = result.npoints if result is not None else 0
+    counts["result_triangles"] = result.ncells if result is not None else 0
+    return times, counts
+
+
+def benchmark(filename, repeat=3, workers=None, cache=False, verbose=False):
+    filename = os.path.abspath(filename)
+    runs = []
+    counts = None
+    with working_directory(os.path.dirname(filename)):
+        for i in range(repeat):
+            with contextlib.ExitStack() as stack:
+                if not verbose:
+                    stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, "w"))))
+                times, counts = run_stages(filename, workers, cache)
+            runs.append(times)
+    stages = {}
+    for name in STAGES:
+        values = [run[name] for run in runs]
+        stages[name] = {"min": min(values), "median": statistics.median(values), "runs": values}
+    total = [sum(run.values()) for run in runs]
+    return {"project": filename, "stages": stages, "total": {"min": min(total),
+            "median": statistics.median(total)}, "counts": counts}
+
+
+def print_result(result):
+    print(os.path.basename(result["project"]))
+    for name in STAGES:
+        print("  {:<10} {:10.3f}s".format(name, result["stages"][name]["median"]))
+    print("  {:<10} {:10.3f}s  ({} -> {} triangles)".format("total", result["total"]["median"],
+                                                           result["counts"]["input_triangles"],
+                                                           result["counts"]["result_triangles"]))
+
+
+def get_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Time the stages of the FTL pipeline.")
+    parser.add_argument("projects", nargs="*", help="existing FTL projects to benchmark as well")
+    parser.add_argument("-s", "--sizes", type=int, nargs="*", default=[10000, 100000],
+                        help="board triangle counts of the synthetic projects")
+    parser.add_argument("--zbends", type=int, default=1, help="ZBend zones per synthetic board")
+    parser.add_argument("--dirbends", type=int, default=1, help="DirBend zones per synthetic board")
+    parser.add_argument("--spirals", type=int, default=1, help="Spiral zones per synthetic board")
+    parser.add_argument("-n", "--repeat", type=int, default=3, help="runs per project")
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="worker processes of the pipeline (default: as configured in the project)")
+    parser.add_argument("--cache", action="store_true", help="use the mesh cache while loading the layers")
+    parser.add_argument("-d", "--data", default="benchmark_data",
+                        help="directory for the synthetic projects")
+    parser.add_argument("-o", "--output", default="benchmark.json", help="JSON file for the results")
+    parser.add_argument("-v", "--verbose", action="store_true", help="show the log output of the pipeline")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = get_arguments(argv)
+    projects = [os.path.abspath(project) for project in args.projects]
+    for size in args.sizes:
+        projects.append(generate_board(args.data, size, args.zbends, args.dirbends, args.spirals))
+
+    results = []
+    for project in projects:
+        result = benchmark(project, args.repeat, args.workers, args.cache, args.verbose)
+        print_result(result)
+        results.append(result)
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "numpy": np.__version__,
+        "vedo": v.__version__,
+        "cpus": os.cpu_count(),
+        "workers": args.workers,
+        "repeat": args.repeat,
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=4)
+    print("Results written to '{}'".format(args.output))
+
+
+if __name__ == "__main__":
+    main()
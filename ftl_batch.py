@@ -0,0 +1,236 @@
+import argparse
+import concurrent.futures
+import contextlib
+import glob
+import json
+import os
+import signal
+import sys
+import time
+import traceback
+
+import vedo as v
+
+from FileParser import FileParser
+from RenderContainer import RenderContainer
+from Progress import *
+from Tracing import span, start_tracing, stop_tracing
+from MeshExport import EXPORT_FORMATS, export_result
+from Cancellation import CancellationToken, Cancelled
+
+FORMATS = ("stl", "ply", "vtk", "obj")
+
+# cancelled by the first SIGINT; the jobs of this process check it while assigning and transforming
+cancel_token = CancellationToken()
+
+
+def handle_sigint(signum, frame):
+    # the first Ctrl+C stops the running jobs at their next check, a second one aborts right away
+    cancel_token.cancel()
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+
+
+def install_sigint_handler():
+    signal.signal(signal.SIGINT, handle_sigint)
+
+
+def find_projects(inputs):
+    projects = []
+    for path in inputs:
+        if os.path.isdir(path):
+            projects.extend(sorted(glob.glob(os.path.join(path, "*.json"))))
+        elif os.path.isfile(path):
+            projects.append(path)
+        else:
+            raise FileNotFoundError("Input not found: {}".format(path))
+    return [os.path.abspath(project) for project in projects]
+
+
+@contextlib.contextmanager
+def working_directory(path):
+    # layer files are given relative to the project file
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+@contextlib.contextmanager
+def timed(times, stage):
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        times[stage] = round(time.monotonic() - started, 3)
+
+
+def print_progress(name, percent, message, eta):
+    if eta is not None:
+        message = "{} (ETA {})".format(message, format_eta(eta))
+    print("[{}] {:3d}% {}".format(name, percent, message), file=sys.stderr)
+
+
+def run_job(filename, output, fmt="stl", workers=None, quiet=False, trace=False, per_layer=False):
+    # Runs one project from parsing to the exported result mesh without any render window. Never raises; failures
+    # end up in the returned status report. STL and PLY results are streamed piece by piece, the other formats need
+    # the merged mesh.
+    name = os.path.splitext(os.path.basename(filename))[0]
+    report = {"project": filename, "status": "failed", "output": None, "error": None, "times": {}}
+    started = time.monotonic()
+    if cancel_token.cancelled():
+        report["status"] = "cancelled"
+        report["time"] = 0
+        return report
+    if trace:
+        start_tracing()
+    try:
+        with contextlib.ExitStack() as stack:
+            sinks = []
+            if quiet:
+                stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, "w"))))
+            else:
+                sinks.append(CallbackProgressSink(lambda percent, message, eta: print_progress(name, percent,
+                                                                                               message, eta)))
+            stack.enter_context(working_directory(os.path.dirname(filename)))
+            reporter = ProgressReporter(sinks, interval=1.0)
+            parser = FileParser(filename, RenderContainer(headless=True), RenderContainer(headless=True),
+                                reporter=reporter)
+            parser.set_token(cancel_token)
+            if workers is not None:
+                parser.workers = workers
+            with timed(report["times"], "parse"):
+                parser.parse()
+            with timed(report["times"], "assign"):
+                parser.calculate_assignments()
+            target = os.path.join(output, "{}_bent.{}".format(name, fmt))
+            if fmt in EXPORT_FORMATS:
+                with timed(report["times"], "transform"):
+                    parser.transformer.start_transformation()
+                with timed(report["times"], "export"):
+                    files = export_result(parser.transformer, target, per_layer)
+                points = sum(points for file, points, faces in files)
+                faces = sum(faces for file, points, faces in files)
+                report["files"] = [file for file, points, faces in files]
+            else:
+                with timed(report["times"], "transform"):
+                    result = parser.render()
+                if result is not None:
+                    with timed(report["times"], "export"), span("export", file=target):
+                        v.write(result, target)
+                points = result.npoints if result is not None else 0
+                faces = result.ncells if result is not None else 0
+            if points == 0:
+                raise ValueError("Project '{}' produced no geometry".format(filename))
+        report["status"] = "ok"
+        report["output"] = target
+        report["points"] = points
+        report["faces"] = faces
+    except Cancelled:
+        report["status"] = "cancelled"
+    except Exception as e:
+        report["error"] = "{}: {}".format(type(e).__name__, e)
+        report["traceback"] = traceback.format_exc()
+    if trace:
+        report["trace"] = os.path.join(output, "{}.trace.json".format(name))
+        stop_tracing(report["trace"])
+    report["time"] = round(time.monotonic() - started, 3)
+    return report
+
+
+def run_batch(projects, output, fmt="stl", workers=1, quiet=False, trace=False, per_layer=False):
+    reports = []
+    if workers > 1 and len(projects) > 1:
+        # projects run side by side, so every project gets a single process
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=install_sigint_handler) as pool:
+            futures = {pool.submit(run_job, project, output, fmt, 1, quiet, trace, per_layer): project
+                       for project in projects}
+            for future in concurrent.futures.as_completed(futures):
+                if cancel_token.cancelled():
+                    for other in futures:
+                        other.cancel()
+                if future.cancelled():
+                    report = {"project": futures[future], "status": "cancelled", "output": None, "error": None,
+                              "times": {}}
+                    print_report(report)
+                    reports.append(report)
+                    continue
+                try:
+                    report = future.result()
+                except Exception as e:
+                    report = {"project": futures[future], "status": "failed", "output": None,
+                              "error": "{}: {}".format(type(e).__name__, e), "times": {}}
+                print_report(report)
+                reports.append(report)
+    else:
+        for project in projects:
+            report = run_job(project, output, fmt, None, quiet, trace, per_layer)
+            print_report(report)
+            reports.append(report)
+    order = {project: i for i, project in enumerate(projects)}
+    return sorted(reports, key=lambda report: order[report["project"]])
+
+
+def print_report(report):
+    if report["status"] == "ok":
+        print("OK     {} -> {} ({}s)".format(report["project"], report["output"], report["time"]))
+    elif report["status"] == "cancelled":
+        print("CANCELLED {}".format(report["project"]))
+    else:
+        print("FAILED {}: {}".format(report["project"], report["error"]))
+
+
+def get_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Transform FTL projects without a render window.")
+    parser.add_argument("inputs", nargs="+", help="FTL project files or directories containing them")
+    parser.add_argument("-o", "--output", default="ftl_output", help="directory for the result meshes")
+    parser.add_argument("-j", "--workers", type=int, default=1,
+                        help="number of projects processed in parallel; 0 uses all cores")
+    parser.add_argument("-f", "--format", choices=FORMATS, default="stl", help="format of the result meshes")
+    parser.add_argument("-l", "--per-layer", action="store_true",
+                        help="write one result file per layer (STL and PLY only)")
+    parser.add_argument("-r", "--report", default=None,
+                        help="path of the JSON status report (default: <output>/report.json)")
+    parser.add_argument("-t", "--trace", action="store_true",
+                        help="write a Chrome trace (<output>/<project>.trace.json) of every job")
+    parser.add_argument("-q", "--quiet", action="store_true", help="suppress the log and progress output of the jobs")
+    args = parser.parse_args(argv)
+    if args.per_layer and args.format not in EXPORT_FORMATS:
+        parser.error("--per-layer is only supported for the formats {}".format(", ".join(EXPORT_FORMATS)))
+    return args
+
+
+def main(argv=None):
+    args = get_arguments(argv)
+    try:
+        projects = find_projects(args.inputs)
+    except FileNotFoundError as e:
+        sys.exit(str(e))
+    if not projects:
+        sys.exit("No project files found.")
+    output = os.path.abspath(args.output)
+    os.makedirs(output, exist_ok=True)
+    workers = args.workers or os.cpu_count()
+
+    install_sigint_handler()
+    started = time.monotonic()
+    reports = run_batch(projects, output, args.format, workers, args.quiet, args.trace,
+                        args.per_layer)
+    failed = [report for report in reports if report["status"] == "failed"]
+    cancelled = [report for report in reports if report["status"] == "cancelled"]
+
+    summary = {"projects": len(reports), "failed": len(failed), "cancelled": len(cancelled), "workers": workers,
+               "time": round(time.monotonic() - started, 3), "jobs": reports}
+    report_path = args.report if args.report else os.path.join(output, "report.json")
+    with open(report_path, "w") as f:
+        json.dump(summary, f, indent=4)
+    print("{}/{} projects transformed, report written to '{}'".format(len(reports) - len(failed) - len(cancelled),
+                                                                      len(reports), report_path))
+    if cancelled:
+        return 130
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
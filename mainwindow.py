@@ -24,6 +24,7 @@ from LinearTransformation import *
 from FileParser import FileParser
 from RenderContainer import *
 from FTLWorker import *
+from Tracing import tracing_enabled
 
 global MODE_GUI
 MODE_GUI = True
@@ -95,6 +96,7 @@ class MainWindow(QtWidgets.QMainWindow):
                      (self.actionReset_View, "zoom-fit-best"),
                      (self.actionRender, "run-build-install-root"),
                      (self.actionUpdate_Footprint, "run-build-configure"),
+                     (self.actionCancel, "process-stop"),
                      (self.bConsClear, "edit-clear-history"),
                      (self.bConsAutoscroll, "gnumeric-format-valign-bottom"),
                      (self.bConsC, "edit-copy")]
@@ -111,7 +113,8 @@ class MainWindow(QtWidgets.QMainWindow):
                      self.actionToolsKiCAD,
                      self.actionReset_View,
                      self.actionUpdate_Footprint,
-                     self.actionRender
+                     self.actionRender,
+                     self.actionCancel
                      # self.actionToolsKiCAD
                      ]
         for item, name in btn_icons:
@@ -158,10 +161,16 @@ class MainWindow(QtWidgets.QMainWindow):
         self.actionFileSave_as.triggered.connect(self.saveAsFileDialog)
         self.actionFileExportVMAP.triggered.connect(self.exportVMAP)
         self.actionFileExportSTL.triggered.connect(self.exportSTL)
+        self.actionFileExportPLY.triggered.connect(self.exportPLY)
         self.actionReset_View.triggered.connect(self.resetView)
         # self.actionReset_View.triggered.connect(self.resetView)
-        self.actionUpdate_Footprint.triggered.connect(self.worker.parse)
+        self.actionUpdate_Footprint.triggered.connect(lambda: self.worker.submitJob("parse"))
+        # a lambda runs on the GUI thread, a slot of the worker would wait for the running job
+        self.actionCancel.triggered.connect(lambda: self.worker.cancel())
         self.actionRender.triggered.connect(self.render_bent)
+        self.actionToolsRecordTrace.setChecked(tracing_enabled())
+        self.actionToolsRecordTrace.toggled.connect(self.worker.setTracing)
+        self.actionToolsExportTrace.triggered.connect(self.exportTrace)
 
         self.wModel.clicked.connect(self.modelItemClicked)
         self.wParams.cellChanged.connect(self.modelParameterChanged)
@@ -173,9 +182,6 @@ class MainWindow(QtWidgets.QMainWindow):
         self.bConsAutoscroll.clicked.connect(self.set_console_autoscroll)
 
         ###     WORKER COMMUNICATION
-        self.sig_parseFile.connect(self.worker.parseFile)
-        self.sig_render.connect(self.worker.render)
-        self.sig_visualize.connect(self.worker.visualize)
         self.sig_updateParser.connect(self.worker.updateParser)
         # self.worker.parsingFinished.connect(self.fileParsed)
         self.worker.fileOpened.connect(self.fileParsed)
@@ -185,6 +191,7 @@ class MainWindow(QtWidgets.QMainWindow):
         # self.worker.updatingFinished.connect(self.sig_visualize)
         self.worker.renderingFinished.connect(self.fpcRendered)
         self.worker.visualizationFinished.connect(self.update_layer_visibilities)
+        self.worker.visualizationFinished.connect(self.floorplanRendered)
         # self.worker.visualizationFinished.connect(self.update_layers)
 
 
@@ -218,9 +225,6 @@ class MainWindow(QtWidgets.QMainWindow):
     #######  SIGNAL/SLOT DEFINITIONS  ######
     #####################################"""
 
-    sig_parseFile = QtCore.pyqtSignal(str)
-    sig_visualize = QtCore.pyqtSignal()
-    sig_render = QtCore.pyqtSignal()
     sig_updateParser = QtCore.pyqtSignal()
 
     def openFileDialog(self):
@@ -253,17 +257,37 @@ class MainWindow(QtWidgets.QMainWindow):
         if not len(file):
             print("VMAP Export aborted.")
             return
-        if not file.endswith(".h5") or not file.endswith(".vmap"):
+        if not file.endswith((".h5", ".vmap")):
             file = file + ".h5"
-        self.worker.exportFile_VMAP(file)
+        self.worker.submitJob("export", "vmap", file)
 
     def exportSTL(self):
         file, _ = QFileDialog.getSaveFileName(self, "Save STL file", filter="*.stl",
                                               options=QFileDialog.Option.DontUseNativeDialog)
         if not len(file):
-            print("VMAP Export aborted.")
+            print("STL Export aborted.")
+            return
+        if not file.lower().endswith(".stl"):
+            file = file + ".stl"
+        self.worker.submitJob("export", "stl", file)
+
+    def exportPLY(self):
+        file, _ = QFileDialog.getSaveFileName(self, "Save PLY file", filter="*.ply",
+                                              options=QFileDialog.Option.DontUseNativeDialog)
+        if not len(file):
+            print("PLY Export aborted.")
+            return
+        if not file.lower().endswith(".ply"):
+            file = file + ".ply"
+        self.worker.submitJob("export", "ply", file)
+
+    def exportTrace(self):
+        file, _ = QFileDialog.getSaveFileName(self, "Save trace file", filter="*.json",
+                                              options=QFileDialog.Option.DontUseNativeDialog)
+        if not len(file):
+            print("Trace export aborted.")
             return
-        self.worker.exportFile_STEP(file)
+        self.worker.exportTrace(file)
 
     def modelItemClicked(self, item):
         self.wParams.blockSignals(True)
@@ -341,16 +365,12 @@ class MainWindow(QtWidgets.QMainWindow):
         val = self.wParams.item(row, 1).text()
         debug("{} = {}".format(label, val))
         # debug (self.wModel.selectedItem().text(0))
-        self.current_model_item[label] = val
+        self.parser.set_parameter(self.current_model_item, label, val)
         # TODO implement isInteger() and auto-conversion
         # self.parser.transformer.visualize()
         # self.update_parser()
-        self.worker.updateModel()
-        self.visualize()
-        self.rcFP.render()
-        # self.update_layer_visibilities()
-
-        self.rcFP.render()
+        # reparsing and visualizing run as one queued job; the floorplan is rendered once it is done
+        self.worker.submitJob("update")
 
     def onTabChange(self, i):
         if i == 0:  # "Floorplan" tab
@@ -502,7 +522,7 @@ class MainWindow(QtWidgets.QMainWindow):
         self.projectFilename = file
 
         # self.parser.parse()
-        self.sig_parseFile.emit(file)
+        self.worker.submitJob("open", file)
         print("Sent signal to open file...")
 
     def update_layers(self):
@@ -654,7 +674,7 @@ class MainWindow(QtWidgets.QMainWindow):
     def floorplanRendered(self):
         print("\nFloorplan rendered, re-rendering view...")
         # self.FPPlt.remove(0)
-        # self.FPPlt.show(self.parser.transformer.debugOutput)
+        # self.FPPlt.show(self.parser.transformer.debugGeometry.build())
         self.rcFP.render()
         # self.resetView()
 
@@ -668,19 +688,19 @@ class MainWindow(QtWidgets.QMainWindow):
         print("\n\nRendered render window.\n")
 
     def render_bent(self):
-        # self.FPPlt.show(self.parser.transformer.debugOutput)
+        # self.FPPlt.show(self.parser.transformer.debugGeometry.build())
         self.console("Rendering... ")
         # self.rcRender.render()
-        self.sig_render.emit()
+        self.worker.submitJob("render")
         # self.rcRender.render()
 
     def visualize(self):
-        self.sig_visualize.emit()
+        self.worker.submitJob("visualize")
 
     def save_file(self, file):
         self.console("Saving file {}...".format(file))
         # self.console("---Not implemented yet---".format(file))
-        json_object = json.dumps(self.parser.j_data, indent=4)
+        json_object = json.dumps(self.parser.copy_project(), indent=4)
         with open(file, "w") as outfile:
             outfile.write(json_object)
             print("File saved successfully")
@@ -12,6 +12,7 @@ from Transformation import *
 from ZBend import *
 from LinearTransformation import *
 from FileParser import FileParser
+from RenderContainer import RenderContainer
 
 debug("LISBeT 0.1")
 plt = Plotter(interactive=False, axes=7)
@@ -21,12 +22,12 @@ if len(sys.argv) < 2:
 if not os.path.isfile(sys.argv[1]):
     sys.exit("File not found: {}".format(sys.argv[1]))
 
-parser = FileParser(sys.argv[1])
+parser = FileParser(sys.argv[1], RenderContainer(plt), RenderContainer(plt))
 
 parser.parse()
-parser.transformer.plotter = plt
+parser.transformer.debugGeometry.enabled = True
 #plt.show(parser.meshes[0])
-parser.visualize(plt)
+parser.visualize()
 parser.calculate_assignments(onlybaselayer=False)
 result = parser.render()
 #parser.meshes[0].c("grey")
@@ -37,7 +38,7 @@ result = parser.render()
 debug("Refining mesh")
 
 #plt.show(parser.meshes)
-plt.show(parser.transformer.debugOutput)
+plt.show(parser.transformer.debugGeometry.build())
 plt.show(result.z(40).c("grey"))
 #parser.visualize(plt)
 
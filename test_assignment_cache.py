@@ -0,0 +1,50 @@
+from types import SimpleNamespace
+
+import numpy as np
+import vedo as v
+
+from AssignmentCache import assignment_key, store_assignment, load_assignment
+from MeshCache import MeshCache
+from ZBend import ZBend, DIR
+
+
+def make_transformer(transformations, cache=None):
+    layers = [SimpleNamespace(meshKey="base", mel=3, mel_trans=1, mel_residual=3),
+              SimpleNamespace(meshKey="copper", mel=3, mel_trans=1, mel_residual=3)]
+    return SimpleNamespace(layers=layers, transformations=transformations, partitioner=False,
+                           reuse_partition=False, assignmentCache=cache or object())
+
+
+def test_key_of_zbend():
+    key = assignment_key(make_transformer([ZBend(120, 180, -62, -40, 180, DIR.POSX, name="TR1_X")]), 1)
+    assert key.startswith("assign-")
+    assert key == assignment_key(make_transformer([ZBend(120, 180, -62, -40, 180, DIR.POSX, name="TR1_X")]), 1)
+    # bend angles do not change the assignment, outlines do
+    assert key == assignment_key(make_transformer([ZBend(120, 180, -62, -40, 90, DIR.POSX, name="TR1_X")]), 1)
+    assert key != assignment_key(make_transformer([ZBend(120, 170, -62, -40, 180, DIR.POSX, name="TR1_X")]), 1)
+    assert key != assignment_key(make_transformer([ZBend(120, 180, -62, -40, 180, DIR.POSX, name="TR1_X")]), 0)
+
+
+def test_key_without_cache():
+    transformer = make_transformer([ZBend(120, 180, -62, -40, 180, DIR.POSX)])
+    transformer.layers[1].meshKey = None
+    assert assignment_key(transformer, 1) is None
+    transformer.layers[1].meshKey = "copper"
+    transformer.assignmentCache = None
+    assert assignment_key(transformer, 1) is None
+
+
+def test_round_trip(tmp_path):
+    cache = MeshCache(str(tmp_path))
+    tr = ZBend(0, 1, 0, 1, 90, DIR.POSX)
+    piece = v.Box(size=(1, 1, 1)).triangulate()
+    fixed = v.Sphere(res=8)
+    store_assignment(cache, "assign-test", {0: piece}, {1: piece.clone()}, fixed, {0: piece},
+                     {1: tr.boundaries}, tr.boundaries)
+    data = load_assignment(cache, "assign-test")
+    assert list(data["pieces"]) == [0] and list(data["residuals"]) == [1] and list(data["scopes"]) == [0]
+    assert np.allclose(data["pieces"][0].points(), piece.points())
+    assert data["fixed"].ncells == fixed.ncells
+    assert data["footprints"][1].equals(tr.boundaries)
+    assert data["footprint"].equals(tr.boundaries)
+    assert load_assignment(cache, "assign-missing") is None
@@ -0,0 +1,79 @@
+import copy
+
+from DependencyGraph import *
+
+
+PROJECT = {
+    "version": 0.1, "mel": 4, "mel_trans": 2, "mel_residual": 4,
+    "layers": [{"name": "PCB", "file": "board.stl", "mel": 3, "mel_trans": 1, "mel_residual": 3},
+               {"name": "Copper", "file": "trace.stl", "mel": 3, "mel_trans": 1, "mel_residual": 3}],
+    "transformations": [
+        {"name": "TR1", "priority": 0, "type": "ZBend", "dir": "POSX", "angle": 90,
+         "xmin": 120, "xmax": 180, "ymin": -62, "ymax": -40},
+        {"name": "TR2", "priority": 0, "type": "ZBend", "dir": "POSX", "angle": 90, "parent": "TR1",
+         "xmin": 190, "xmax": 200, "ymin": -62, "ymax": -40},
+        {"name": "TR3", "priority": 0, "type": "ZBend", "dir": "NEGY", "angle": 90,
+         "xmin": 42, "xmax": 63, "ymin": -100, "ymax": -130},
+    ],
+}
+
+
+def edited(**edits):
+    # copy of PROJECT with the "layers/0/mel" style paths set
+    ret = copy.deepcopy(PROJECT)
+    for path, value in edits.items():
+        node = ret
+        keys = path.split("/")
+        for key in keys[:-1]:
+            node = node[int(key)] if isinstance(node, list) else node[key]
+        node[keys[-1]] = value
+    return ret
+
+
+def stages(new):
+    changes = diff_project(PROJECT, new)
+    return build_pipeline_graph(new, changes).stages(changes)
+
+
+def test_diff_finds_changed_keys():
+    assert diff_project(PROJECT, copy.deepcopy(PROJECT)) == set()
+    new = edited(**{"mel": 5, "layers/1/mel_trans": 2, "transformations/0/angle": "45"})
+    assert diff_project(PROJECT, new) == {("global", "mel"), ("layer", 1, "mel_trans"),
+                                          ("transformation", "TR1", "angle")}
+    # values typed into the GUI arrive as strings
+    assert diff_project(PROJECT, edited(**{"transformations/0/angle": "90"})) == set()
+
+
+def test_diff_detects_structure_changes():
+    new = copy.deepcopy(PROJECT)
+    new["transformations"].pop()
+    assert diff_project(PROJECT, new) is None
+    assert diff_project(PROJECT, edited(**{"transformations/2/name": "TR4"})) is None
+    assert diff_project(PROJECT, edited(**{"transformations/2/type": "DirBend"})) is None
+    assert diff_project(PROJECT, edited(**{"transformations/2/parent": "TR1"})) is None
+
+
+def test_angle_only_retransforms_its_chain():
+    assert stages(edited(**{"transformations/0/angle": 45})) == {
+        (TRANSFORM, "TR1"), (TRANSFORM, "TR1-Res"), (TRANSFORM, "TR2"), (TRANSFORM, "TR2-Res"), (MERGE,)}
+    assert stages(edited(**{"transformations/2/angle": 45})) == {
+        (TRANSFORM, "TR3"), (TRANSFORM, "TR3-Res"), (MERGE,)}
+
+
+def test_zone_change_reassigns():
+    result = stages(edited(**{"transformations/2/xmax": 70}))
+    assert (ASSIGN,) in result and (LOAD, 0) not in result
+    assert {(SUBDIVIDE, name) for name in transformation_names(PROJECT)} <= result
+
+
+def test_layer_parameters():
+    assert stages(edited(**{"layers/0/file": "other.stl"})) >= {(LOAD, 0), (ASSIGN,), (MERGE,)}
+    assert (LOAD, 1) not in stages(edited(**{"layers/0/file": "other.stl"}))
+    assert stages(edited(**{"layers/1/mel_residual": 2})) == {
+        (SUBDIVIDE, "TR1-Res"), (TRANSFORM, "TR1-Res"), (SUBDIVIDE, "TR2-Res"), (TRANSFORM, "TR2-Res"),
+        (SUBDIVIDE, "TR3-Res"), (TRANSFORM, "TR3-Res"), (TRANSFORM, "TR2"), (MERGE,)}
+    assert stages(edited(**{"layers/0/color": "red"})) == {(MERGE,)}
+
+
+def test_passive_parameters():
+    assert stages(edited(**{"transformations/0/color": "red", "workers": 4, "version": 0.2})) == set()
@@ -0,0 +1,50 @@
+import json
+
+import numpy as np
+import vedo as v
+
+from FileParser import FileParser
+from Progress import ProgressReporter
+
+
+def make_project(tmp_path):
+    board = str(tmp_path / "board.stl")
+    v.Box(pos=(50, 0, 0), size=(100, 40, 1)).triangulate().write(board)
+    project = {"version": 0.1, "mel": 4, "mel_trans": 2, "mel_residual": 4, "cache": False,
+               "layers": [{"name": "PCB", "file": board, "mel": 4, "mel_trans": 2, "mel_residual": 4}],
+               "transformations": [{"name": "TR1", "priority": 0, "type": "ZBend", "dir": "POSX", "angle": 90,
+                                    "xmin": 40, "xmax": 60, "ymin": -20, "ymax": 20}]}
+    filename = str(tmp_path / "project.json")
+    with open(filename, "w") as f:
+        json.dump(project, f)
+    return FileParser(filename, reporter=ProgressReporter([]))
+
+
+def test_update_applies_changed_parameter(tmp_path):
+    parser = make_project(tmp_path)
+    parser.parse()
+    parser.j_transformations[0]["angle"] = 45
+    parser.update()
+    assert parser.transformer.transformations[0].angle == np.deg2rad(45)
+    assert parser.snapshot["transformations"][0]["angle"] == 45
+
+
+def test_edit_during_update_is_applied_next(tmp_path):
+    parser = make_project(tmp_path)
+    parser.parse()
+    parser.j_transformations[0]["angle"] = 45
+    add_transformations = parser.add_transformations
+
+    def edit_while_running():
+        # the GUI edits the project while the update builds the transformations
+        parser.j_transformations[0]["angle"] = 30
+        add_transformations()
+
+    parser.add_transformations = edit_while_running
+    parser.update()
+    parser.add_transformations = add_transformations
+    assert parser.transformer.transformations[0].angle == np.deg2rad(45)
+    assert parser.snapshot["transformations"][0]["angle"] == 45
+    parser.update()
+    assert parser.transformer.transformations[0].angle == np.deg2rad(30)
+    assert parser.snapshot["transformations"][0]["angle"] == 30
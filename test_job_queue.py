@@ -0,0 +1,96 @@
+from types import SimpleNamespace
+
+import pytest
+from PyQt6 import QtCore
+
+from FTLWorker import FTLWorker, JobQueue, DEBOUNCE_MS
+
+
+def test_requests_of_a_kind_coalesce():
+    jobs = JobQueue()
+    jobs.submit("render")
+    jobs.submit("visualize")
+    generation = jobs.submit("render")
+    assert jobs.take() == [("visualize", 1, ()), ("render", generation, ())]
+    assert jobs.take() == []
+
+
+def test_jobs_run_in_pipeline_order():
+    jobs = JobQueue()
+    jobs.submit("render")
+    jobs.submit("update")
+    jobs.submit("parse")
+    jobs.submit("visualize")
+    # parsing visualizes anyway
+    assert [kind for kind, generation, args in jobs.take()] == ["parse", "update", "render"]
+    jobs.submit("export", "stl", "a.stl")
+    jobs.submit("visualize")
+    jobs.submit("open", "project.json")
+    assert jobs.take() == [("open", 1, ("project.json",))]
+
+
+def test_exports_are_appended():
+    jobs = JobQueue()
+    jobs.submit("export", "stl", "a.stl")
+    jobs.submit("export", "vmap", "a.vmap")
+    assert jobs.take() == [("export", 1, ("stl", "a.stl")), ("export", 2, ("vmap", "a.vmap"))]
+    assert jobs.is_current("export", 1)
+
+
+def test_newer_request_outdates_running_job():
+    jobs = JobQueue()
+    generation = jobs.submit("update")
+    jobs.take()
+    assert jobs.is_current("update", generation)
+    jobs.submit("update")
+    assert not jobs.is_current("update", generation)
+
+
+def test_parameter_change_invalidates_render():
+    jobs = JobQueue()
+    generation = jobs.submit("render")
+    jobs.take()
+    jobs.submit("update")
+    assert not jobs.is_current("render", generation)
+    # a render requested after the change works on the new parameters
+    rerun = jobs.submit("render")
+    jobs.take()
+    assert jobs.is_current("render", rerun)
+
+
+def test_unknown_job():
+    with pytest.raises(ValueError, match="Unknown job"):
+        JobQueue().submit("print")
+
+
+@pytest.fixture
+def worker():
+    app = QtCore.QCoreApplication.instance() or QtCore.QCoreApplication([])
+    ret = FTLWorker(SimpleNamespace(console=lambda text: None, parser=None))
+    ret.calls = []
+    ret.updateJob = lambda: ret.calls.append("update")
+    ret.render = lambda: ret.calls.append("render")
+    yield ret
+    ret.exportPool.shutdown()
+
+
+def wait(ms):
+    loop = QtCore.QEventLoop()
+    QtCore.QTimer.singleShot(ms, loop.quit)
+    loop.exec()
+
+
+def test_debounce(worker):
+    for i in range(5):
+        worker.submitJob("update")
+        worker.submitJob("render")
+    assert worker.calls == []
+    wait(3 * DEBOUNCE_MS)
+    assert worker.calls == ["update", "render"]
+
+
+def test_running_render_is_repeated_after_update(worker):
+    worker.current = ("render", 1)
+    worker.submitJob("update")
+    worker.current = None
+    assert [kind for kind, generation, args in worker.jobs.take()] == ["update", "render"]
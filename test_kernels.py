@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from Transformation import Transformation, rotation_z_affine, apply_affine
+from LinearTransformation import LinearTransformation
+from ZBend import ZBend, DIR
+from DirBend import DirBend
+from Spiral import Spiral
+
+
+def zone_points(xmin, xmax, ymin, ymax, count=500, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.column_stack((rng.uniform(xmin, xmax, count), rng.uniform(ymin, ymax, count),
+                            rng.uniform(0, 1.6, count)))
+
+
+def per_point(tr, points):
+    # the per-vertex path the kernels replace
+    return Transformation.transformPoints(tr, points)
+
+
+@pytest.mark.parametrize("direction", list(DIR))
+@pytest.mark.parametrize("angle", [30, 90, 180])
+def test_zbend_kernel_matches_matrices(direction, angle):
+    tr = ZBend(10, 30, -5, 15, angle, direction)
+    points = zone_points(10, 30, -5, 15)
+    assert np.allclose(tr.transformPoints(points), per_point(tr, points), rtol=0, atol=1e-12)
+
+
+def test_linear_kernel_matches_matrix():
+    mat = np.array([[0, -1, 0, 2], [1, 0, 0, -3], [0, 0, 1, 0.5]], dtype=float)
+    tr = LinearTransformation(mat, None)
+    points = zone_points(-10, 10, -10, 10)
+    assert np.allclose(tr.transformPoints(points), per_point(tr, points), rtol=0, atol=1e-12)
+
+
+def test_linear_kernel_folds_rotation():
+    mat = np.array([[0, 0, -1, 5], [0, 1, 0, 0], [1, 0, 0, 1]], dtype=float)
+    pivot = (3, 4, 0)
+    tr = LinearTransformation(mat, None, angle=0.3, pivot=pivot)
+    points = zone_points(-10, 10, -10, 10)
+    expected = []
+    for p in points:
+        rotated = rotation_z_affine(0.3, pivot) @ (*p, 1)
+        moved = mat @ (*rotated, 1)
+        expected.append(rotation_z_affine(-0.3, pivot) @ (*moved, 1))
+    assert np.allclose(tr.transformPoints(points), expected, rtol=0, atol=1e-12)
+
+
+def per_point_rotated(tr, points):
+    # DirBend matrices work in the frame rotated onto the baseline
+    rotated = apply_affine(tr.rot, points)
+    moved = [tr.getMatrixAt(p) @ (*p, 1) for p in rotated]
+    return apply_affine(tr.rot_back, moved)
+
+
+def test_dirbend_kernel_matches_matrices():
+    corners = [(56, 61), (84, 40), (96, 56), (68, 77)]
+    tr = DirBend({"name": "D", "angle": 90, "points": [{"x": x, "y": y} for x, y in corners]}, name="D")
+    # around the zone, so the fixed and residual sides are covered as well
+    points = zone_points(40, 110, 30, 90, count=2000)
+    assert np.allclose(tr.transformPoints(points), per_point_rotated(tr, points), rtol=0, atol=1e-9)
+
+
+def test_spiral_kernel_matches_matrices():
+    tr = Spiral({"name": "S", "dir": float(np.pi / 2 - np.arctan2(3, 4)), "length": 20, "turns": 1,
+                 "points": [{"x": 96, "y": 61}, {"x": 124, "y": 40}]}, name="S")
+    points = zone_points(80, 150, 30, 90, count=2000)
+    assert np.allclose(tr.transformPoints(points), per_point_rotated(tr, points), rtol=0, atol=1e-9)
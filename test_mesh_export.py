@@ -0,0 +1,79 @@
+import os
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+import vedo as v
+
+import MeshExport
+from MeshExport import PlyWriter, write_meshes, export_result, get_format
+from StlFile import map_stl
+
+
+def make_pieces():
+    return [v.Box(pos=(0, 0, 0), size=(2, 1, 1)).triangulate(), v.Sphere(pos=(5, 0, 0), res=12),
+            v.Plane(pos=(0, 5, 0), res=(3, 3)).triangulate()]
+
+
+def triangles(meshes):
+    return np.concatenate([np.asarray(mesh.points(), dtype=np.float32)[np.asarray(mesh.faces())] for mesh in meshes])
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    # several writes per piece
+    monkeypatch.setattr(MeshExport, "CHUNK_SIZE", 16)
+
+
+def test_stl_round_trip(tmp_path, small_chunks):
+    pieces = make_pieces()
+    filename = str(tmp_path / "result.stl")
+    npoints, nfaces = write_meshes(filename, pieces)
+    assert npoints == sum(mesh.npoints for mesh in pieces) and nfaces == sum(mesh.ncells for mesh in pieces)
+    records = map_stl(filename)
+    assert len(records) == nfaces
+    assert np.array_equal(records["vertices"], triangles(pieces))
+    assert np.allclose(np.linalg.norm(records["normal"], axis=1), 1)
+    assert v.load(filename).ncells == nfaces
+
+
+def test_ply_round_trip(tmp_path, small_chunks):
+    pieces = make_pieces()
+    filename = str(tmp_path / "result.ply")
+    npoints, nfaces = write_meshes(filename, pieces)
+    mesh = v.load(filename)
+    assert mesh.npoints == npoints and mesh.ncells == nfaces
+    points = np.asarray(mesh.points(), dtype=np.float32)
+    assert np.array_equal(points[np.asarray(mesh.faces())], triangles(pieces))
+
+
+def test_ply_counts_are_checked(tmp_path):
+    box = v.Box().triangulate()
+    with pytest.raises(ValueError, match="announced"):
+        with PlyWriter(str(tmp_path / "short.ply"), box.npoints + 1, box.ncells) as writer:
+            writer.write_points(box.points())
+            writer.write_faces(np.asarray(box.faces()), box.npoints)
+    with PlyWriter(str(tmp_path / "order.ply"), box.npoints, box.ncells) as writer:
+        writer.write_points(box.points())
+        writer.write_faces(np.asarray(box.faces()), box.npoints)
+        with pytest.raises(ValueError, match="before the faces"):
+            writer.write_points(box.points())
+
+
+def test_unknown_format():
+    with pytest.raises(ValueError, match="Unknown export format"):
+        get_format("result.obj")
+
+
+def test_export_per_layer(tmp_path):
+    pieces = make_pieces()
+    transformer = SimpleNamespace(
+        layers=[SimpleNamespace(name="PCB"), SimpleNamespace(name="Copper"), SimpleNamespace(name="Empty")],
+        get_result_pieces=lambda: [(0, "fixed", pieces[0]), (0, "TR1", pieces[1]), (1, "fixed", pieces[2]),
+                                   (2, "fixed", None)])
+    filename = str(tmp_path / "result.stl")
+    files = export_result(transformer, filename, per_layer=True)
+    assert [os.path.basename(target) for target, npoints, nfaces in files] == ["result_PCB.stl", "result_Copper.stl"]
+    assert files[0][2] == pieces[0].ncells + pieces[1].ncells and files[1][2] == pieces[2].ncells
+    assert export_result(transformer, filename) == [(filename, sum(mesh.npoints for mesh in pieces),
+                                                     sum(mesh.ncells for mesh in pieces))]
@@ -0,0 +1,69 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+import vedo as v
+
+from MatrixTransformer import MatrixTransformer
+from Progress import ProgressReporter
+from ZBend import ZBend, DIR
+
+
+def make_transformer(*transformations):
+    # nesting as FileParser builds it: parents first, every zone in the residual flap of its parent
+    transformer = MatrixTransformer(reporter=ProgressReporter([]))
+    transformer.add_layer(SimpleNamespace(mesh=v.Box(pos=(50, 60, 0.8), size=(100, 120, 1.6))))
+    parent = None
+    for tr in transformations:
+        tr.parentTransformation = parent
+        transformer.add_transformation(tr)
+        parent = tr
+    return transformer
+
+
+def flap_points(ymin, ymax, count=300, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.column_stack((rng.uniform(0, 100, count), rng.uniform(ymin, ymax, count), rng.uniform(0, 1.6, count)))
+
+
+def test_chain_of_three_folds():
+    outer = ZBend(0, 100, 20, 30, 90, DIR.POSY, name="outer")
+    middle = ZBend(0, 100, 50, 60, 45, DIR.POSY, name="middle")
+    inner = ZBend(0, 100, 80, 90, 30, DIR.POSY, name="inner")
+    make_transformer(outer, middle, inner)
+    assert outer.residual.parentTransformation is None
+    assert middle.residual.parentTransformation is outer and inner.residual.parentTransformation is middle
+
+    # every zone is bent by its own kernel and then carried along by the residual flaps of all its ancestors
+    points = flap_points(80, 90)
+    expected = outer.residual.transformPoints(middle.residual.transformPoints(inner.transformPoints(points)))
+    assert np.allclose(inner.transformChainPoints(points), expected, rtol=0, atol=1e-9)
+
+    points = flap_points(90, 120)
+    expected = outer.residual.transformPoints(middle.residual.transformPoints(inner.residual.transformPoints(points)))
+    assert np.allclose(inner.residual.transformChainPoints(points), expected, rtol=0, atol=1e-9)
+
+    points = flap_points(50, 60)
+    expected = outer.residual.transformPoints(middle.transformPoints(points))
+    assert np.allclose(middle.transformChainPoints(points), expected, rtol=0, atol=1e-9)
+    assert np.allclose(outer.transformChainPoints(points), outer.transformPoints(points))
+
+
+def test_chain_keeps_flaps_attached():
+    outer = ZBend(0, 100, 20, 30, 90, DIR.POSY, name="outer")
+    inner = ZBend(0, 100, 60, 70, 90, DIR.POSY, name="inner")
+    make_transformer(outer, inner)
+    # the start of the inner zone and of the flaps behind the zones lie where the flap before them ends
+    edge = np.array([[50, 60, 0.8]])
+    assert np.allclose(inner.transformChainPoints(edge), outer.residual.transformChainPoints(edge))
+    edge = np.array([[50, 70, 0.8]])
+    assert np.allclose(inner.transformChainPoints(edge), inner.residual.transformChainPoints(edge))
+
+
+def test_nesting_needs_a_residual():
+    outer = ZBend(0, 100, 20, 30, 90, DIR.POSY, name="outer")
+    transformer = make_transformer(outer)
+    inner = ZBend(0, 100, 60, 70, 90, DIR.POSY, name="inner")
+    inner.parentTransformation = outer.residual
+    with pytest.raises(ValueError, match="has no residual"):
+        transformer.add_transformation(inner)
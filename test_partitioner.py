@@ -0,0 +1,106 @@
+import pickle
+from types import SimpleNamespace
+
+import numpy as np
+import vedo as v
+
+from MatrixTransformer import MatrixTransformer
+from Partitioner import partition_mesh, LayerPartition
+from Progress import ProgressReporter
+from Transformation import mesh_to_arrays
+from ZBend import ZBend, DIR
+
+
+def plate(ysize=40, res=(25, 10)):
+    return v.Plane(pos=(50, 0, 0), s=(100, ysize), res=res).triangulate()
+
+
+def make_transformations(mesh, *transformations):
+    transformer = MatrixTransformer(reporter=ProgressReporter([]))
+    transformer.add_layer(SimpleNamespace(mesh=mesh))
+    for tr in transformations:
+        transformer.add_transformation(tr)
+    return transformer.transformations
+
+
+def centers(mesh):
+    points, faces = mesh_to_arrays(mesh)
+    return points[faces].mean(axis=1)
+
+
+def test_zone_residual_and_fixed():
+    mesh = plate()
+    transformations = make_transformations(mesh, ZBend(40, 60, -30, 30, 90, DIR.POSX, name="TR1"))
+    ret = partition_mesh(mesh, transformations)
+    assert list(ret.zones) == [0] and list(ret.residuals) == [0]
+    zone, (residual,), fixed = ret.zones[0], ret.residuals[0], ret.fixed
+    assert np.isclose(zone.area(), 20 * 40) and np.isclose(residual.area(), 40 * 40)
+    assert np.isclose(fixed.area(), 40 * 40)
+    assert np.all((centers(zone)[:, 0] > 40) & (centers(zone)[:, 0] < 60))
+    assert np.all(centers(residual)[:, 0] > 60) and np.all(centers(fixed)[:, 0] < 40)
+
+
+def test_zone_cuts_straddling_triangles():
+    # the zone edges run through the middle of grid cells, so those triangles are clipped along the outline
+    mesh = plate()
+    transformations = make_transformations(mesh, ZBend(42, 58, -30, 30, 90, DIR.POSX, name="TR1"))
+    ret = partition_mesh(mesh, transformations)
+    assert np.isclose(ret.zones[0].area(), 16 * 40)
+    assert np.isclose(ret.residuals[0][0].area(), 42 * 40) and np.isclose(ret.fixed.area(), 42 * 40)
+
+
+def test_zone_containing_every_triangle():
+    mesh = plate()
+    transformations = make_transformations(mesh, ZBend(-10, 110, -30, 30, 90, DIR.POSX, name="TR1"))
+    ret = partition_mesh(mesh, transformations)
+    assert np.isclose(ret.zones[0].area(), 100 * 40)
+    assert ret.residuals == {0: []}
+    assert ret.fixed is None
+
+
+def test_without_zones():
+    mesh = plate()
+    ret = partition_mesh(mesh, [])
+    assert ret.fixed is mesh and ret.zones == {} and ret.residuals == {}
+
+
+def make_layer_partition():
+    # the partition of the base plate as the assignment of layer 0 leaves it
+    mesh = plate()
+    transformations = make_transformations(mesh, ZBend(40, 60, -30, 30, 90, DIR.POSX, name="TR1"))
+    zone, residual = transformations
+    ret = partition_mesh(mesh, transformations)
+    zone.layerIds, zone.meshes = [0], [ret.zones[0]]
+    residual.layerIds, residual.meshes = [0], ret.residuals[0]
+    return LayerPartition.from_transformations(transformations, 0)
+
+
+def check_trace(layer_partition):
+    # a trace along the plate, stacked on it
+    trace = v.Plane(pos=(50, 0, 0), s=(90, 10), res=(45, 5)).triangulate().z(1)
+    pieces, residuals, fixed = layer_partition.apply(trace)
+    assert list(pieces) == [0] and list(residuals) == [1]
+    assert np.isclose(pieces[0].area(), 20 * 10)
+    assert np.isclose(residuals[1].area(), 35 * 10) and np.all(centers(residuals[1])[:, 0] > 60)
+    assert np.isclose(fixed.mesh.area(), 35 * 10) and np.all(centers(fixed.mesh)[:, 0] < 40)
+
+
+def test_layer_partition_apply():
+    layer_partition = make_layer_partition()
+    assert layer_partition.zoneIds == [0] and layer_partition.residualIds == [1]
+    check_trace(layer_partition)
+
+
+def test_layer_partition_pickles():
+    layer_partition = make_layer_partition()
+    layer_partition.get_trees()
+    copy = pickle.loads(pickle.dumps(layer_partition))
+    assert copy.trees is None
+    assert all(isinstance(outline, np.ndarray) for outline in copy.outlines)
+    check_trace(copy)
+
+
+def test_layer_partition_without_zones():
+    trace = plate()
+    pieces, residuals, fixed = LayerPartition([], [], [], [], []).apply(trace)
+    assert pieces == {} and residuals == {} and fixed.mesh is trace
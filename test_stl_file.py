@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+import StlFile
+from StlFile import read_stl, weld_vertices, is_binary_stl, map_stl
+from SyntheticBoard import write_stl
+
+# two triangles of a unit square sharing an edge, and one collapsed triangle
+TRIANGLES = np.array([[[0, 0, 0], [1, 0, 0], [1, 1, 0]],
+                      [[0, 0, 0], [1, 1, 0], [0, 1, 0]],
+                      [[1, 1, 0], [1, 1, 0], [0, 1, 0]]], dtype=np.float32)
+
+
+def write_ascii_stl(filename, triangles):
+    with open(filename, "w") as f:
+        f.write("solid test\n")
+        for triangle in triangles:
+            f.write("  facet normal 0 0 1\n    outer loop\n")
+            for x, y, z in triangle:
+                f.write("      vertex {!r} {!r} {!r}\n".format(float(x), float(y), float(z)))
+            f.write("    endloop\n  endfacet\n")
+        f.write("endsolid test\n")
+
+
+def check_square(points, faces):
+    assert points.shape == (4, 3) and faces.shape == (2, 3)
+    assert np.array_equal(points[faces], TRIANGLES[:2])
+
+
+def test_binary(tmp_path):
+    filename = str(tmp_path / "square.stl")
+    write_stl(filename, TRIANGLES)
+    assert is_binary_stl(filename)
+    assert len(map_stl(filename)) == 3
+    check_square(*read_stl(filename))
+
+
+def test_binary_header_starting_with_solid(tmp_path):
+    filename = str(tmp_path / "square.stl")
+    write_stl(filename, TRIANGLES)
+    with open(filename, "r+b") as f:
+        f.write(b"solid exported")
+    assert is_binary_stl(filename)
+    check_square(*read_stl(filename))
+
+
+def test_ascii(tmp_path):
+    filename = str(tmp_path / "square.stl")
+    write_ascii_stl(filename, TRIANGLES)
+    assert not is_binary_stl(filename)
+    check_square(*read_stl(filename))
+
+
+def test_empty(tmp_path):
+    filename = str(tmp_path / "empty.stl")
+    write_stl(filename, np.zeros((0, 3, 3), dtype=np.float32))
+    with pytest.raises(ValueError, match="no triangles"):
+        read_stl(filename)
+
+
+def test_weld_negative_zero():
+    triangles = TRIANGLES.copy()
+    triangles[1, 0] = -0.0
+    points, ids = weld_vertices(triangles)
+    assert len(points) == 4 and ids[0] == ids[3]
+    assert not np.signbit(points).any()
+
+
+def test_weld_falls_back_on_key_collisions(monkeypatch):
+    # with all multipliers zero every vertex gets the same key, so the rows have to be compared
+    monkeypatch.setattr(StlFile, "WELD_HASH", (np.uint64(0),) * 3)
+    points, ids = weld_vertices(TRIANGLES)
+    assert len(points) == 4
+    assert np.array_equal(points[ids].reshape(-1, 3, 3), TRIANGLES)
+
+
+def test_weld_mapped_records(tmp_path):
+    rng = np.random.default_rng(0)
+    # corners drawn from a small pool, so most of them are shared
+    pool = rng.uniform(-10, 10, (50, 3)).astype(np.float32)
+    triangles = pool[rng.integers(0, len(pool), (400, 3))]
+    filename = str(tmp_path / "random.stl")
+    write_stl(filename, triangles)
+    points, ids = weld_vertices(map_stl(filename)["vertices"])
+    assert len(points) == len(np.unique(triangles.reshape(-1, 3), axis=0))
+    assert np.array_equal(points[ids].reshape(-1, 3, 3), triangles)
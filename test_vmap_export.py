@@ -0,0 +1,60 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+import vedo as v
+
+import VmapExport
+from VmapExport import VMAP_GEOMETRY, MemoryVmapWriter, H5VmapWriter, export_vmap, get_piece_arrays
+
+
+def make_pieces():
+    return [("PCB_fixed", v.Box(size=(2, 1, 1)).triangulate(), {"MYLAYER": 0, "MYTRANSFORMATION": "fixed"}),
+            ("PCB_TR1", v.Sphere(res=12), {"MYLAYER": 0, "MYTRANSFORMATION": "TR1"}),
+            ("Copper_TR1", v.Plane(res=(3, 3)).triangulate(), {"MYLAYER": 1, "MYTRANSFORMATION": "TR1"})]
+
+
+def check_round_trip(writer, paths, pieces):
+    assert paths == ["{}/{}".format(VMAP_GEOMETRY, i + 1) for i in range(len(pieces))]
+    for path, (name, mesh, attrs) in zip(paths, pieces):
+        read_name, points, faces = writer.read_geometry(path)
+        expected_points, expected_faces = get_piece_arrays(mesh)
+        assert read_name == name
+        assert np.array_equal(points, expected_points)
+        assert np.array_equal(faces, expected_faces)
+
+
+def test_memory_round_trip():
+    pieces = make_pieces()
+    writer = MemoryVmapWriter()
+    paths = export_vmap(None, pieces, workers=2, writer=writer)
+    check_round_trip(writer, paths, pieces)
+    assert writer.groups[paths[2]]["attrs"] == {"MYLAYER": 1, "MYTRANSFORMATION": "TR1"}
+
+
+def test_h5_round_trip(tmp_path):
+    pytest.importorskip("h5py")
+    pieces = make_pieces()
+    filename = str(tmp_path / "result.vmap")
+    with H5VmapWriter(filename, chunk_rows=16) as writer:
+        paths = export_vmap(filename, pieces, workers=2, writer=writer)
+        check_round_trip(writer, paths, pieces)
+        group = writer.file[paths[1]]
+        assert group.attrs["MYLAYER"] == 0
+        assert group["POINTS/MYCOORDINATES"].chunks == (16, 3)
+        assert group["POINTS/MYCOORDINATES"].compression == "gzip"
+
+
+def test_vmt_writer_keeps_chunks(tmp_path, monkeypatch):
+    h5py = pytest.importorskip("h5py")
+    # VMeshTools is not on PyPI; stands in for the system group its file handler creates
+    monkeypatch.setattr(VmapExport, "vmt", SimpleNamespace(
+        VMAPFileHandler=lambda filename: h5py.File(filename, "w").require_group("VMAP/SYSTEM")))
+    pieces = make_pieces()
+    filename = str(tmp_path / "result.vmap")
+    with VmapExport.get_vmap_writer(filename) as writer:
+        assert isinstance(writer, VmapExport.VmtVmapWriter)
+        paths = export_vmap(filename, pieces, workers=2, writer=writer)
+        check_round_trip(writer, paths, pieces)
+        assert "VMAP/SYSTEM" in writer.file
+        assert writer.file[paths[1]]["ELEMENTS/MYCONNECTIVITY"].compression == "gzip"